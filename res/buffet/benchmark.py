@@ -0,0 +1,159 @@
+# Benchmarks for the buffet simulation in buffet_model.py
+# Copyright 2019 Max Shinn <max@maxshinnpotential.com>
+#
+# Times initialisation, simulation and summary statistics separately
+# for each engine, varying one of n_people, n_dishes and p_want at a
+# time from a default buffet.  Each cell is written as one JSON object
+# per line (by default to cache/benchmark.jsonl), so results from
+# different versions of the engines can be compared with --baseline.
+# For example:
+#
+#     python benchmark.py --output new.jsonl --baseline old.jsonl
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import buffet_model as bm
+
+# Default buffet, and the values to try for each parameter
+DEFAULTS = {"n_people": 100, "n_dishes": 6, "p_want": .8}
+SWEEPS = {"n_people": [30, 100, 1000, 10000, 100000],
+          "n_dishes": [6, 20, 60, 200],
+          "p_want": [.1, .3, .8, 1]}
+
+# The polling engine is the reference, and the rest are candidates.
+# "batch" only simulates the single queue buffet.
+ENGINES = ["timestep", "event", "array", "batch"]
+
+# Cold import time budget for buffet_model, in seconds
+IMPORT_BUDGET = .5
+
+def run_once(engine, run_func, n_people, n_dishes, p_want, rng):
+    """Simulate one buffet, returning the time taken by each stage and
+    the number of events (people leaving a dish)."""
+    t0 = time.perf_counter()
+    if engine == "batch":
+        dish_speed, person_speed, wants, serving = bm.sample_buffet(rng, p_wanted=p_want, n_people=n_people, n_dishes=n_dishes)
+    elif engine == "array":
+        state = bm.init_state(p_wanted=p_want, n_people=n_people, n_dishes=n_dishes, rng=rng)
+    else:
+        DISHES, PEOPLE = bm.init_dishes_people(p_wanted=p_want, n_people=n_people, n_dishes=n_dishes, rng=rng)
+    t1 = time.perf_counter()
+    if engine == "batch":
+        departures = bm.single_queue_departures(serving[None])[0]
+    elif engine == "array":
+        DISHES, PEOPLE = bm.ENGINES[engine][run_func](state)
+    else:
+        bm.ENGINES[engine][run_func](DISHES, PEOPLE)
+    t2 = time.perf_counter()
+    if engine == "batch":
+        waits = np.max(np.where(wants, departures, 0), axis=-1)
+        np.quantile(waits, [.25, .5, .75])
+    else:
+        bm.summarize_run(DISHES, PEOPLE, run_func, p_want)
+    t3 = time.perf_counter()
+    if run_func == "single": # Includes the batch engine
+        events = n_people * n_dishes
+    else:
+        events = sum(len(p.wanted) for p in PEOPLE)
+    return {"init": t1-t0, "simulate": t2-t1, "stats": t3-t2}, events
+
+def bench_cell(engine, run_func, n_people, n_dishes, p_want, repeats=3, seed=0):
+    """Benchmark a single cell, taking the fastest of `repeats` runs for
+    each stage, and measure peak memory with tracemalloc on one more
+    run.  (tracemalloc slows things down, so it is not used while
+    timing.)"""
+    times = {"init": [], "simulate": [], "stats": []}
+    for r in range(0, repeats):
+        t, events = run_once(engine, run_func, n_people, n_dishes, p_want, np.random.default_rng([seed, r]))
+        for k,v in t.items():
+            times[k].append(v)
+    tracemalloc.start()
+    run_once(engine, run_func, n_people, n_dishes, p_want, np.random.default_rng([seed, 0]))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    best = {k : min(v) for k,v in times.items()}
+    return {"engine": engine, "run_func": run_func, "n_people": n_people,
+            "n_dishes": n_dishes, "p_want": p_want,
+            "init_s": best["init"], "simulate_s": best["simulate"], "stats_s": best["stats"],
+            "events": events, "events_per_s": events/best["simulate"] if best["simulate"] > 0 else None,
+            "peak_memory_bytes": peak}
+
+def bench_import():
+    """Time a cold import of buffet_model in a fresh interpreter."""
+    code = "import time; t = time.perf_counter(); import buffet_model; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                         capture_output=True, text=True, check=True)
+    t = float(out.stdout.strip().split("\n")[-1])
+    return {"engine": "import", "import_s": t, "budget_s": IMPORT_BUDGET, "within_budget": t <= IMPORT_BUDGET}
+
+def cells(engines, run_funcs, reference_max_people):
+    """All cells to benchmark: for each parameter, sweep it with the
+    others at their defaults."""
+    seen = set()
+    for param,values in SWEEPS.items():
+        for v in values:
+            params = dict(DEFAULTS, **{param: v})
+            for engine in engines:
+                for run_func in run_funcs:
+                    if engine == "batch" and run_func != "single":
+                        continue
+                    if engine == "timestep" and params["n_people"] > reference_max_people:
+                        continue
+                    key = (engine, run_func, params["n_people"], params["n_dishes"], params["p_want"])
+                    if key not in seen:
+                        seen.add(key)
+                        yield key
+
+def compare(results, baseline_file, threshold):
+    """Print cells which are more than `threshold` times slower than in
+    `baseline_file`."""
+    with open(baseline_file, "r") as f:
+        baseline = [json.loads(l) for l in f if l.strip()]
+    key = lambda r : (r.get("engine"), r.get("run_func"), r.get("n_people"), r.get("n_dishes"), r.get("p_want"))
+    old = {key(r) : r for r in baseline}
+    for r in results:
+        if key(r) not in old:
+            continue
+        for stage in ["init_s", "simulate_s", "stats_s", "import_s"]:
+            if stage in r and old[key(r)].get(stage):
+                ratio = r[stage]/old[key(r)][stage]
+                if ratio > threshold:
+                    print("REGRESSION %s %s: %.3gs -> %.3gs (%.2fx)" % (key(r), stage, old[key(r)][stage], r[stage], ratio))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the buffet simulation engines")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "benchmark.jsonl"),
+                        help="File to write results to, one JSON object per line (by default, in the cache directory)")
+    parser.add_argument("--engines", nargs="+", default=ENGINES, choices=ENGINES)
+    parser.add_argument("--run-funcs", nargs="+", default=["separate", "single"], choices=["separate", "single"])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reference-max-people", type=int, default=1000,
+                        help="Skip the (slow) polling engine for buffets bigger than this")
+    parser.add_argument("--baseline", help="Results file from a previous version to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression")
+    args = parser.parse_args()
+    bm.set_contract_checks(False)
+    meta = {"python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    results = [dict(bench_import(), **meta)]
+    print("Import: %.3fs (budget %.1fs)" % (results[0]["import_s"], IMPORT_BUDGET))
+    for engine, run_func, n_people, n_dishes, p_want in cells(args.engines, args.run_funcs, args.reference_max_people):
+        r = dict(bench_cell(engine, run_func, n_people, n_dishes, p_want, repeats=args.repeats, seed=args.seed), **meta)
+        results.append(r)
+        print("%-8s %-8s people=%-6i dishes=%-3i p_want=%-4g init=%.4fs sim=%.4fs stats=%.4fs %.3g events/s peak=%.1fMB" %
+              (engine, run_func, n_people, n_dishes, p_want, r["init_s"], r["simulate_s"], r["stats_s"],
+               r["events_per_s"] or 0, r["peak_memory_bytes"]/1e6))
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        for r in results:
+            f.write(json.dumps(r) + "\n")
+    if args.baseline:
+        compare(results, args.baseline, args.threshold)
@@ -1,23 +1,38 @@
 # Model code for "Are buffets efficient?"
 # Copyright 2019 Max Shinn <max@maxshinnpotential.com>
+#
+# This module only contains the simulation, and importing it has no
+# side effects.  The figures are made by make_figures.py.  Importing
+# it should stay cheap (under 0.5 seconds on a cold start, which
+# benchmark.py checks), so scipy.stats, pandas and names are only
+# imported by the functions which need them.
 
 import paranoid as pns
 import numpy as np
-import scipy as sp
-import scipy.stats
 import random
-import names
-import pandas
-import matplotlib.pyplot as plt
-import seaborn as sns
+import heapq
+import os
+import json
+import hashlib
+import itertools
+import collections
+import concurrent.futures
+
+def set_contract_checks(enabled=True):
+    """Turn paranoid's runtime checks (e.g. on `get_random_speed`) on or
+    off.  They are useful for development, but add overhead to every
+    call, so turn them off for production runs."""
+    pns.settings.Settings.set(enabled=enabled)
 
 @pns.returns(pns.Positive)
 def get_random_dish_speed():
-    return sp.stats.gamma.rvs(a=10, scale=.1)
+    import scipy.stats
+    return scipy.stats.gamma.rvs(a=10, scale=.1)
 
 @pns.returns(pns.Positive)
 def get_random_speed():
-    return sp.stats.gamma.rvs(a=10, scale=.1)
+    import scipy.stats
+    return scipy.stats.gamma.rvs(a=10, scale=.1)
 
 
 class Dish:
@@ -26,14 +41,14 @@ class Dish:
     Maintains two variables:
 
     - `speed` - A constant describing the rate at which this dish is consumed.
-    - `queue` - A list describing people waiting in line to serve themselves this dish.
+    - `queue` - A deque describing people waiting in line to serve themselves this dish.
     """
     def __init__(self, speed=None, p_want=.8, name=None):
         if speed is None:
             speed = get_random_dish_speed()
         self.speed = speed
         self.p_want = p_want
-        self.queue = []
+        self.queue = collections.deque()
         if name is None:
             name = "dish%i" % int(np.random.rand()*10000)
         self.name = name
@@ -62,7 +77,7 @@ class Dish:
         if self.queue[0].check_if_done_serving(time):
             if len(self.queue) > 1:
                 self.queue[1].start_serving(self, time)
-            return self.queue.pop(0)
+            return self.queue.popleft()
 
 class Person:
     """A person at a buffet.
@@ -70,29 +85,37 @@ class Person:
     Maintains information about the dishes they would like to eat
     (`wants`), a constant describing their speed (`speed`), and the
     time it takes them to serve for each dish `dishtimes`, which is
-    precomputed.
+    precomputed unless it is passed in.
     """
-    def __init__(self, wants, speed=None):
+    def __init__(self, wants, speed=None, dishtimes=None):
         if speed is None:
             speed = get_random_speed()
         self.speed = speed
         self.wants = wants
         self.current_dish = None
-        self.dishtimes = {}
-        for d in wants:
-            self.dishtimes[d] = self.get_dish_wait_time(d)
+        if dishtimes is None:
+            dishtimes = {d : self.get_dish_wait_time(d) for d in wants}
+        self.dishtimes = dishtimes
         # Statistics
         self.total_serving_time = sum([self.dishtimes[d] for d in self.wants])
         self.wanted = wants.copy()
-        self.name = names.get_first_name()
+        self._name = None
         self.total_waiting_time = 0
         self.dishwaits = {}
     def __repr__(self):
         return self.name
+    @property
+    def name(self):
+        """A random first name, chosen the first time it is needed."""
+        if self._name is None:
+            import names
+            self._name = names.get_first_name()
+        return self._name
     def get_dish_wait_time(self, d):
         """Return a sample from some distribution to determine serving time."""
+        import scipy.stats
         scale_param = self.speed*d.speed
-        return sp.stats.lognorm.rvs(1)*scale_param
+        return scipy.stats.lognorm.rvs(1)*scale_param
     def is_serving(self):
         """Is the person currently serving themselves, i.e. at the front of a queue."""
         return (self.current_dish is not None)
@@ -117,21 +140,133 @@ class Person:
                 self.total_waiting_time = time
             return True
         return False
-    def choose_next_dish(self):
-        """Decide which one to go to next and return it.  If none left, return None."""
+    def choose_next_dish(self, queues=None):
+        """Decide which one to go to next and return it.  If none left, return None.
+
+        If `queues` is a ShortestQueueIndex of the dishes, use it
+        instead of sorting the dishes by queue length.
+        """
         if not self.wants:
             return None
+        if queues is not None:
+            return queues.shortest(queues.mask(self.wants))
         shortest = next(iter(sorted(self.wants, key=lambda x : len(x.queue))))
         return shortest
 
+class ShortestQueueIndex:
+    """An index of queue lengths for finding the shortest queue.
+
+    The dishes `items` are numbered in order, and `below[L]` is a
+    bitmask (a python int) of the dishes whose queue has at most L
+    people.  These are nested, so the shortest queue among any set of
+    dishes is in the first mask which intersects it, which we find by
+    binary search.  Someone joining or leaving a queue only changes
+    one mask.  So both operations are O(log(longest queue)), with no
+    sorting.
+
+    `tie_break` decides between equally short queues: "first" takes
+    the first in `items` (like Person.choose_next_dish), "last" the
+    last, and "random" chooses uniformly using the numpy Generator
+    `rng`, so it is reproducible given a seed.
+    """
+    def __init__(self, items, tie_break="first", rng=None):
+        if tie_break not in ["first", "last", "random"]:
+            raise ValueError("Invalid tie break")
+        self.items = list(items)
+        self.index = {d : j for j,d in enumerate(self.items)}
+        self.length = [0]*len(self.items)
+        self.all = (1 << len(self.items)) - 1
+        self.below = [self.all]
+        self.tie_break = tie_break
+        if tie_break == "random" and rng is None:
+            rng = np.random.default_rng()
+        self.rng = rng
+    def mask(self, items):
+        """The bitmask for a collection of dishes."""
+        m = 0
+        for d in items:
+            m |= 1 << self.index[d]
+        return m
+    def add(self, item):
+        """Record that someone joined the queue for dish `item`."""
+        j = self.index[item]
+        L = self.length[j]
+        self.below[L] &= ~(1 << j)
+        if L+1 == len(self.below):
+            self.below.append(self.all)
+        self.length[j] = L+1
+    def remove(self, item):
+        """Record that someone left the queue for dish `item`."""
+        j = self.index[item]
+        L = self.length[j] - 1
+        self.below[L] |= 1 << j
+        self.length[j] = L
+    def shortest(self, mask):
+        """Return the dish with the shortest queue out of those in bitmask
+        `mask`, or None if `mask` is empty."""
+        if not mask:
+            return None
+        # The last mask contains every dish, so this always succeeds.
+        lo, hi = 0, len(self.below)-1
+        while lo < hi:
+            mid = (lo+hi)//2
+            if self.below[mid] & mask:
+                hi = mid
+            else:
+                lo = mid+1
+        tied = self.below[lo] & mask
+        if self.tie_break == "last":
+            return self.items[tied.bit_length()-1]
+        if self.tie_break == "random":
+            for _ in range(0, int(self.rng.integers(tied.bit_count()))):
+                tied &= tied - 1 # Clear the lowest bit
+        return self.items[(tied & -tied).bit_length()-1]
+
 
 TIMESTEP = .01
 
-def init_dishes_people(n_wanted=None, p_wanted=.8, n_people=100, n_dishes=6):
+def sample_buffet(rng, n_wanted=None, p_wanted=.8, n_people=100, n_dishes=6):
+    """Draw all of the random quantities for a buffet at once.
+
+    This uses the same distributions as `get_random_dish_speed`,
+    `get_random_speed` and `Person.get_dish_wait_time`, but draws
+    everything with a handful of calls to the numpy Generator `rng`.
+    Returns a tuple of (dish speeds, person speeds, wants, serving
+    times), where wants is an (n_people, n_dishes) boolean matrix and
+    serving times are 0 for dishes a person doesn't want.
+    """
+    dish_speed = rng.gamma(10, .1, size=n_dishes)
+    person_speed = rng.gamma(10, .1, size=n_people)
+    if p_wanted is not None and n_wanted is None:
+        wants = rng.random((n_people, n_dishes)) < p_wanted
+    elif p_wanted is None and n_wanted is not None:
+        wants = np.zeros((n_people, n_dishes), dtype=bool)
+        chosen = np.argsort(rng.random((n_people, n_dishes)), axis=1)[:,0:n_wanted]
+        np.put_along_axis(wants, chosen, True, axis=1)
+    else:
+        raise ValueError("Invalid function argument")
+    serving = rng.lognormal(0, 1, size=(n_people, n_dishes)) * np.outer(person_speed, dish_speed)
+    serving[~wants] = 0
+    return (dish_speed, person_speed, wants, serving)
+
+def init_dishes_people(n_wanted=None, p_wanted=.8, n_people=100, n_dishes=6, rng=None):
     """Create two lists: one of Person objects and the other of Dish
     objects, with each one "linked" to the other.  Return a tuple of
     ([dish objects], [people objects]).
+
+    If `rng` is a numpy Generator, draw everything up front with
+    `sample_buffet` instead of one scipy call per random number.
     """
+    if rng is not None:
+        dish_speed, person_speed, wants, serving = sample_buffet(rng, n_wanted=n_wanted, p_wanted=p_wanted,
+                                                                 n_people=n_people, n_dishes=n_dishes)
+        DISHES = [Dish(speed=s, p_want=p_wanted, name="dish%i" % j) for j,s in enumerate(dish_speed)]
+        PEOPLE = []
+        for i in range(0, n_people):
+            wanted = np.flatnonzero(wants[i])
+            PEOPLE.append(Person(wants=[DISHES[j] for j in wanted], speed=person_speed[i],
+                                 dishtimes={DISHES[j] : serving[i,j] for j in wanted}))
+        return (DISHES, PEOPLE)
     if p_wanted is not None and n_wanted is None:
         DISHES = [Dish(p_want=p_wanted) for _ in range(0, n_dishes)]
         PEOPLE = [Person(wants=[d for d in DISHES if np.random.rand() < d.p_want]) for _ in range(0, n_people)]
@@ -182,186 +317,800 @@ def run_single_queue(DISHES, PEOPLE):
         t += TIMESTEP
     return (DISHES,PEOPLE)
 
-def run_sims(run_func="separate", N=100, p_want=.8, n_people=100, n_dishes=6):
-    """Simulate many runs and collect the results into a dict for simple analysis"""
-    f = run_separate_queues if run_func == "separate" else run_single_queue if run_func == "single" else None
-    runs = []
-    for i in range(0, N):
-        print("Running %i" % i)
-        DISHES, PEOPLE = f(*init_dishes_people(p_wanted=p_want, n_people=n_people, n_dishes=n_dishes))
-        stats = {"max_wait": max(p.total_waiting_time for p in PEOPLE),
-                 "min_wait": min(p.total_waiting_time for p in PEOPLE),
-                 "mean_wait": np.mean([p.total_waiting_time for p in PEOPLE]),
-                 "median_wait": np.quantile([p.total_waiting_time for p in PEOPLE], .5),
-                 "1st_quart_wait": np.quantile([p.total_waiting_time for p in PEOPLE], .25),
-                 "3rd_quart_wait": np.quantile([p.total_waiting_time for p in PEOPLE], .75),
-                 "fastest_dish_speed": min(d.speed for d in DISHES),
-                 "slowest_dish_speed": max(d.speed for d in DISHES),
-                 "mean_dish_speed": np.mean([d.speed for d in DISHES]),
-                 "slowest_person_speed": min([1/p.speed for p in PEOPLE]),
-                 "mean_person_speed": np.mean([1/p.speed for p in PEOPLE]),
-                 "p_want": p_want,
-                 "run_func": run_func,
-        }
-        runs.append(stats)
-    return runs
+def _completion_time(dish):
+    """Time at which the person at the front of `dish`'s queue will be
+    done serving themself.  People who don't want the dish (only
+    possible in a single queue) pass it without any delay."""
+    person = dish.queue[0]
+    return person.start_time + person.dishtimes.get(dish, 0)
+
+def run_separate_queues_events(DISHES, PEOPLE, tie_break="first", rng=None):
+    """Simulate using a separate queue for each dish.
+
+    This is equivalent to `run_separate_queues`, but instead of
+    advancing time by TIMESTEP and polling every dish, it keeps a heap
+    of the times at which the person at the front of each queue will
+    finish.  Only the front person of a queue can finish, so there is
+    at most one event per dish in the heap.  Simultaneous events are
+    processed in the order of DISHES, as in the polling version.
+
+    People choose their next dish using a ShortestQueueIndex, with
+    ties broken according to `tie_break` and `rng`.
+    """
+    queues = ShortestQueueIndex(DISHES, tie_break=tie_break, rng=rng)
+    # Keep track of the dishes each person still wants as a bitmask.
+    wants = {p : queues.mask(p.wants) for p in PEOPLE}
+    events = []
+    def enqueue(dish, person, t):
+        dish.add_to_queue(person, time=t)
+        queues.add(dish)
+        if len(dish.queue) == 1:
+            heapq.heappush(events, (_completion_time(dish), queues.index[dish]))
+    # Init the people and dishes
+    for p in PEOPLE:
+        dish = queues.shortest(wants[p])
+        if dish is not None:
+            enqueue(dish, p, 0)
+    # Run the simulation
+    while events:
+        t, i = heapq.heappop(events)
+        person = DISHES[i].check_queue(t)
+        assert person is not None
+        queues.remove(DISHES[i])
+        wants[person] &= ~(1 << i)
+        if DISHES[i].queue:
+            heapq.heappush(events, (_completion_time(DISHES[i]), i))
+        dish = queues.shortest(wants[person])
+        if dish is not None:
+            enqueue(dish, person, t)
+    return (DISHES,PEOPLE)
+
+def run_single_queue_events(DISHES, PEOPLE):
+    """Simulate using a single queue for all dishes.
+
+    This is the event-driven equivalent of `run_single_queue`; see
+    `run_separate_queues_events` for details.
+    """
+    events = []
+    def enqueue(i, person, t):
+        DISHES[i].add_to_queue(person, time=t)
+        if len(DISHES[i].queue) == 1:
+            heapq.heappush(events, (_completion_time(DISHES[i]), i))
+    # Init the people and dishes
+    for p in PEOPLE:
+        enqueue(0, p, 0)
+    # Run the simulation
+    while events:
+        t, i = heapq.heappop(events)
+        person = DISHES[i].check_queue(t)
+        assert person is not None
+        if DISHES[i].queue:
+            heapq.heappush(events, (_completion_time(DISHES[i]), i))
+        if i < len(DISHES)-1:
+            enqueue(i+1, person, t)
+    return (DISHES,PEOPLE)
+
+class BuffetState:
+    """The state of every dish and person in a buffet, stored as arrays.
+
+    This holds the same information as lists of Dish and Person
+    objects, but as a structure of arrays:
+
+    - `dish_speed`, `person_speed` and `serving` - The speed constants
+      and the (n_people, n_dishes) matrix of serving times, as numpy
+      arrays, since they never change.
+    - `wanted` and `wants` - Bitmasks (python ints, bit j is dish j) of
+      the dishes each person wanted originally and still wants.
+    - `head`, `tail`, `queue_length` and `next_in_queue` - The queue
+      for each dish, as a linked list.  A person waits in at most one
+      queue at a time, so a single `next_in_queue` list holds all of
+      the queues, and adding or removing a person is O(1).
+    - `current_dish` and `start_time` - Per person simulation state, as
+      in Person.  A `current_dish` of -1 means the person is not
+      serving.
+    - `total_waiting_time` - The result for each person, as a numpy
+      array.
+
+    The simulation state is kept in python lists rather than numpy
+    arrays, because the engines update it one element at a time, and
+    indexing numpy arrays with scalars is slow.  People and dishes are
+    referred to by their index.  `dishes` and `people` give Dish- and
+    Person-like views for computing statistics.
+    """
+    def __init__(self, dish_speed, person_speed, serving, wants):
+        self.dish_speed = np.asarray(dish_speed, dtype=float)
+        self.person_speed = np.asarray(person_speed, dtype=float)
+        self.serving = np.asarray(serving, dtype=float)
+        self.n_people, self.n_dishes = self.serving.shape
+        packed = np.packbits(np.asarray(wants, dtype=bool), axis=1, bitorder="little")
+        self.wanted = [int.from_bytes(row.tobytes(), "little") for row in packed]
+        self.wants = list(self.wanted)
+        self.head = [-1]*self.n_dishes
+        self.tail = [-1]*self.n_dishes
+        self.queue_length = [0]*self.n_dishes
+        self.next_in_queue = [-1]*self.n_people
+        self.current_dish = [-1]*self.n_people
+        self.start_time = [0.]*self.n_people
+        self.total_waiting_time = np.zeros(self.n_people)
+    @classmethod
+    def from_objects(cls, DISHES, PEOPLE):
+        """Build the state from lists of Dish and Person objects, such as
+        those returned by `init_dishes_people`."""
+        index = {d : j for j,d in enumerate(DISHES)}
+        serving = np.zeros((len(PEOPLE), len(DISHES)))
+        wants = np.zeros((len(PEOPLE), len(DISHES)), dtype=bool)
+        for i,p in enumerate(PEOPLE):
+            for d in p.wanted:
+                serving[i,index[d]] = p.dishtimes[d]
+                wants[i,index[d]] = True
+        return cls([d.speed for d in DISHES], [p.speed for p in PEOPLE], serving, wants)
+    @property
+    def dishes(self):
+        return [DishView(self, j) for j in range(0, self.n_dishes)]
+    @property
+    def people(self):
+        return [PersonView(self, i) for i in range(0, self.n_people)]
+    def _indices(self, mask):
+        """Indices of the dishes in bitmask `mask`."""
+        return [j for j in range(0, self.n_dishes) if mask >> j & 1]
+    def still_wants(self, i):
+        """Indices of the dishes person `i` still wants."""
+        return self._indices(self.wants[i])
+    def iter_queue(self, j):
+        """Iterate through the people in dish `j`'s queue, in order."""
+        i = self.head[j]
+        while i != -1:
+            yield i
+            i = self.next_in_queue[i]
+    def add_to_queue(self, j, i, time):
+        """Put person `i` at the end of dish `j`'s queue.  If they are at
+        the front, they start serving and this returns True."""
+        self.next_in_queue[i] = -1
+        if self.queue_length[j] == 0:
+            self.head[j] = i
+        else:
+            self.next_in_queue[self.tail[j]] = i
+        self.tail[j] = i
+        self.queue_length[j] += 1
+        if self.queue_length[j] == 1:
+            self.start_serving(j, i, time)
+            return True
+        return False
+    def start_serving(self, j, i, time):
+        """Person `i` starts serving from dish `j`."""
+        assert self.current_dish[i] == -1
+        self.current_dish[i] = j
+        self.start_time[i] = time
+    def completion_time(self, j):
+        """Time at which the person at the front of dish `j`'s queue will
+        be done.  Unwanted dishes have a serving time of 0."""
+        i = self.head[j]
+        return self.start_time[i] + self.serving.item(i, j)
+    def pop_queue(self, j, time):
+        """The person at the front of dish `j`'s queue is done serving.
+        Remove them from the queue, start the next person serving, and
+        return the index of the person who was removed."""
+        i = self.head[j]
+        self.current_dish[i] = -1
+        self.start_time[i] = 0.
+        if self.wants[i] >> j & 1:
+            self.wants[i] &= ~(1 << j)
+            if not self.wants[i]:
+                self.total_waiting_time[i] = time
+        self.head[j] = self.next_in_queue[i]
+        self.queue_length[j] -= 1
+        if self.queue_length[j] == 0:
+            self.tail[j] = -1
+        else:
+            self.start_serving(j, self.head[j], time)
+        return i
+    def wants_mask(self, i):
+        """The dishes person `i` still wants, as a bitmask like those in
+        ShortestQueueIndex."""
+        return self.wants[i]
+    def choose_next_dish(self, i):
+        """The dish with the shortest queue that person `i` still wants,
+        or None if they are done.  Ties go to the lowest index.  This
+        is O(n_dishes); the simulation uses a ShortestQueueIndex."""
+        candidates = self.still_wants(i)
+        if len(candidates) == 0:
+            return None
+        return min(candidates, key=lambda j : self.queue_length[j])
+
+class DishView:
+    """A read-only view with the same attributes as a Dish, for dish
+    `index` of BuffetState `state`."""
+    __slots__ = ("state", "index")
+    def __init__(self, state, index):
+        self.state = state
+        self.index = index
+    def __repr__(self):
+        return "dish%i" % self.index
+    def __eq__(self, other):
+        return isinstance(other, DishView) and self.state is other.state and self.index == other.index
+    def __hash__(self):
+        return hash((id(self.state), self.index))
+    @property
+    def speed(self):
+        return self.state.dish_speed[self.index]
+    @property
+    def queue(self):
+        return [PersonView(self.state, i) for i in self.state.iter_queue(self.index)]
+
+class PersonView:
+    """A read-only view with the same attributes as a Person, for
+    person `index` of BuffetState `state`."""
+    __slots__ = ("state", "index")
+    def __init__(self, state, index):
+        self.state = state
+        self.index = index
+    def __repr__(self):
+        return "person%i" % self.index
+    def __eq__(self, other):
+        return isinstance(other, PersonView) and self.state is other.state and self.index == other.index
+    def __hash__(self):
+        return hash((id(self.state), self.index))
+    @property
+    def speed(self):
+        return self.state.person_speed[self.index]
+    @property
+    def wanted(self):
+        return [DishView(self.state, j) for j in self.state._indices(self.state.wanted[self.index])]
+    @property
+    def wants(self):
+        return [DishView(self.state, j) for j in self.state.still_wants(self.index)]
+    @property
+    def dishtimes(self):
+        return {d : self.state.serving[self.index,d.index] for d in self.wanted}
+    @property
+    def total_serving_time(self):
+        return self.state.serving[self.index].sum()
+    @property
+    def total_waiting_time(self):
+        return self.state.total_waiting_time[self.index]
+    @property
+    def current_dish(self):
+        j = self.state.current_dish[self.index]
+        return None if j == -1 else DishView(self.state, j)
+
+def init_state(n_wanted=None, p_wanted=.8, n_people=100, n_dishes=6, rng=None):
+    """Like `init_dishes_people`, but return a BuffetState.  If `rng` is
+    a numpy Generator, no objects are created at all."""
+    if rng is not None:
+        dish_speed, person_speed, wants, serving = sample_buffet(rng, n_wanted=n_wanted, p_wanted=p_wanted,
+                                                                 n_people=n_people, n_dishes=n_dishes)
+        return BuffetState(dish_speed, person_speed, serving, wants)
+    return BuffetState.from_objects(*init_dishes_people(n_wanted=n_wanted, p_wanted=p_wanted,
+                                                        n_people=n_people, n_dishes=n_dishes))
+
+def run_separate_queues_state(state, tie_break="first", rng=None):
+    """Simulate using a separate queue for each dish.
+
+    This is the same event-driven simulation as
+    `run_separate_queues_events`, but on a BuffetState.  Returns views
+    of the dishes and people.
+    """
+    queues = ShortestQueueIndex(range(0, state.n_dishes), tie_break=tie_break, rng=rng)
+    events = []
+    def enqueue(j, i, t):
+        queues.add(j)
+        if state.add_to_queue(j, i, t):
+            heapq.heappush(events, (state.completion_time(j), j))
+    # Init the people and dishes
+    for i in range(0, state.n_people):
+        j = queues.shortest(state.wants_mask(i))
+        if j is not None:
+            enqueue(j, i, 0)
+    # Run the simulation
+    while events:
+        t, j = heapq.heappop(events)
+        i = state.pop_queue(j, t)
+        queues.remove(j)
+        if state.queue_length[j]:
+            heapq.heappush(events, (state.completion_time(j), j))
+        nextdish = queues.shortest(state.wants_mask(i))
+        if nextdish is not None:
+            enqueue(nextdish, i, t)
+    return (state.dishes, state.people)
 
-# Set up the colors we will use for plotting
-pal = sns.color_palette()
-
-# Simulate for different probabilities of wanting a given dish
-sims = run_sims("separate", N=100)
-sims2 = run_sims("single", N=100)
-sims3 = run_sims("separate", N=100, p_want=.3)
-sims4 = run_sims("single", N=100, p_want=.3)
-sims5 = run_sims("separate", N=100, p_want=1)
-sims6 = run_sims("single", N=100, p_want=1)
-
-# Combine all simulations into a pandas data frame
-df = pandas.DataFrame(sims+sims2+sims3+sims4+sims5+sims6)
-# Create more sensible names for the columns
-df["Inequality"] = df["3rd_quart_wait"] - df["1st_quart_wait"]
-df.rename(columns={'p_want': 'Probability of wanting a dish',
-                   'mean_wait': 'Mean wait time',
-                   'run_func': 'Buffet type'}, inplace=True)
-
-# Make a bar plot of the simulations with default parameters
-ax = plt.subplot(2,1,1)
-agg = df.groupby(["Buffet type", "Probability of wanting a dish"])["Mean wait time"].agg([np.mean, scipy.stats.sem])
-agg['mean'].unstack(0).plot(kind='bar', yerr=agg['sem'].unstack(0), ax=ax, rot=0, color=pal)
-plt.xlabel("")
-plt.ylabel("Mean wait time")
-ax = plt.subplot(2,1,2)
-agg = df.groupby(["Buffet type", "Probability of wanting a dish"])["Inequality"].agg([np.mean, scipy.stats.sem])
-agg['mean'].unstack(0).plot(kind='bar', yerr=agg['sem'].unstack(0), ax=ax, rot=0, color=pal)
-plt.ylabel("Inequality")
-ax.get_legend().remove()
-plt.tight_layout()
-plt.savefig("wait-ineq-few-dishes.png")
-plt.show()
-
-# Repeat all of the above, but for many dishes
-sims = run_sims("separate", N=100, p_want=.1, n_dishes=20)
-sims2 = run_sims("single", N=100, p_want=.1, n_dishes=20)
-sims3 = run_sims("separate", N=100, p_want=.2, n_dishes=20)
-sims4 = run_sims("single", N=100, p_want=.2, n_dishes=20)
-sims5 = run_sims("separate", N=100, p_want=.3, n_dishes=20)
-sims6 = run_sims("single", N=100, p_want=.3, n_dishes=20)
-sims7 = run_sims("separate", N=100, p_want=.4, n_dishes=20)
-sims8 = run_sims("single", N=100, p_want=.4, n_dishes=20)
-
-dfmd = pandas.DataFrame(sims+sims2+sims3+sims4+sims5+sims6+sims7+sims8)
-dfmd["Inequality"] = dfmd["3rd_quart_wait"] - dfmd["1st_quart_wait"]
-
-dfmd.rename(columns={'p_want': 'Probability of wanting a dish',
-                   'mean_wait': 'Mean wait time',
-                   'run_func': 'Buffet type'}, inplace=True)
-ax = plt.subplot(2,1,1)
-agg = dfmd.groupby(["Buffet type", "Probability of wanting a dish"])["Mean wait time"].agg([np.mean, scipy.stats.sem])
-agg['mean'].unstack(0).plot(kind='bar', yerr=agg['sem'].unstack(0), ax=ax, rot=0, color=pal)
-plt.xlabel("")
-plt.ylabel("Mean wait time")
-ax = plt.subplot(2,1,2)
-agg = dfmd.groupby(["Buffet type", "Probability of wanting a dish"])["Inequality"].agg([np.mean, scipy.stats.sem])
-agg['mean'].unstack(0).plot(kind='bar', yerr=agg['sem'].unstack(0), ax=ax, rot=0, color=pal)
-plt.ylabel("Inequality")
-ax.get_legend().remove()
-plt.tight_layout()
-plt.savefig("wait-ineq-many-dishes.png")
-plt.show()
-
-# Repeat all of the above, but for many people
-sims = run_sims("separate", N=100, n_people=500)
-sims2 = run_sims("single", N=100, n_people=500)
-sims3 = run_sims("separate", N=100, p_want=.3, n_people=500)
-sims4 = run_sims("single", N=100, p_want=.3, n_people=500)
-sims5 = run_sims("separate", N=100, p_want=1, n_people=500)
-sims6 = run_sims("single", N=100, p_want=1, n_people=500)
-
-dfmp = pandas.DataFrame(sims+sims2+sims3+sims4+sims5+sims6)
-dfmp["Inequality"] = dfmp["3rd_quart_wait"] - dfmp["1st_quart_wait"]
-
-dfmp.rename(columns={'p_want': 'Probability of wanting a dish',
-                   'mean_wait': 'Mean wait time',
-                   'run_func': 'Buffet type'}, inplace=True)
-ax = plt.subplot(2,1,1)
-agg = dfmp.groupby(["Buffet type", "Probability of wanting a dish"])["Mean wait time"].agg([np.mean, scipy.stats.sem])
-agg['mean'].unstack(0).plot(kind='bar', yerr=agg['sem'].unstack(0), ax=ax, rot=0, color=pal)
-plt.xlabel("")
-plt.ylabel("Mean wait time")
-ax = plt.subplot(2,1,2)
-agg = dfmp.groupby(["Buffet type", "Probability of wanting a dish"])["Inequality"].agg([np.mean, scipy.stats.sem])
-agg['mean'].unstack(0).plot(kind='bar', yerr=agg['sem'].unstack(0), ax=ax, rot=0, color=pal)
-plt.ylabel("Inequality")
-ax.get_legend().remove()
-plt.tight_layout()
-plt.savefig("wait-ineq-many-people.png")
-plt.show()
-
-# Repeat all of the above, but for many very few people
-sims = run_sims("separate", N=100, n_people=30)
-sims2 = run_sims("single", N=100, n_people=30)
-sims3 = run_sims("separate", N=100, p_want=.3, n_people=30)
-sims4 = run_sims("single", N=100, p_want=.3, n_people=30)
-sims5 = run_sims("separate", N=100, p_want=1, n_people=30)
-sims6 = run_sims("single", N=100, p_want=1, n_people=30)
-
-dffp = pandas.DataFrame(sims+sims2+sims3+sims4+sims5+sims6)
-dffp["Inequality"] = dffp["3rd_quart_wait"] - dffp["1st_quart_wait"]
-
-dffp.rename(columns={'p_want': 'Probability of wanting a dish',
-                   'mean_wait': 'Mean wait time',
-                   'run_func': 'Buffet type'}, inplace=True)
-ax = plt.subplot(2,1,1)
-agg = dffp.groupby(["Buffet type", "Probability of wanting a dish"])["Mean wait time"].agg([np.mean, scipy.stats.sem])
-agg['mean'].unstack(0).plot(kind='bar', yerr=agg['sem'].unstack(0), ax=ax, rot=0, color=pal)
-plt.xlabel("")
-plt.ylabel("Mean wait time")
-ax = plt.subplot(2,1,2)
-agg = dffp.groupby(["Buffet type", "Probability of wanting a dish"])["Inequality"].agg([np.mean, scipy.stats.sem])
-agg['mean'].unstack(0).plot(kind='bar', yerr=agg['sem'].unstack(0), ax=ax, rot=0, color=pal)
-plt.ylabel("Inequality")
-ax.get_legend().remove()
-plt.tight_layout()
-plt.savefig("wait-ineq-veryfew-people.png")
-plt.show()
-
-def run_sims_people(run_func="separate", N=100, p_want=.8, n_people=100, n_dishes=6):
+def run_single_queue_state(state):
+    """Simulate using a single queue for all dishes.
+
+    This is the same event-driven simulation as
+    `run_single_queue_events`, but on a BuffetState.  Returns views of
+    the dishes and people.
+    """
+    events = []
+    def enqueue(j, i, t):
+        if state.add_to_queue(j, i, t):
+            heapq.heappush(events, (state.completion_time(j), j))
+    # Init the people and dishes
+    for i in range(0, state.n_people):
+        enqueue(0, i, 0)
+    # Run the simulation
+    while events:
+        t, j = heapq.heappop(events)
+        i = state.pop_queue(j, t)
+        if state.queue_length[j]:
+            heapq.heappush(events, (state.completion_time(j), j))
+        if j < state.n_dishes-1:
+            enqueue(j+1, i, t)
+    return (state.dishes, state.people)
+
+def single_queue_departures(serving_times):
+    """Find the time each person leaves each dish in a single queue.
+
+    `serving_times` is an array of shape (..., n_people, n_dishes),
+    where leading dimensions index independent runs and dishes a
+    person doesn't want have a serving time of 0.  Everyone joins the
+    queue at time 0 in order.  Departures follow the tandem queue
+    recurrence D[i,j] = max(D[i-1,j], D[i,j-1]) + s[i,j], which for a
+    fixed dish j unrolls to
+
+        D[i,j] = C[i] + max_{k<=i} (D[k,j-1] - C[k-1]),
+
+    where C is the cumulative sum of s[:,j] over people.  So we only
+    need to loop over dishes, and each step is a cumulative max over
+    people for all runs at once.
+    """
+    s = np.asarray(serving_times, dtype=float)
+    departures = np.empty_like(s)
+    prev = np.zeros(s.shape[:-1])
+    for j in range(0, s.shape[-1]):
+        C = np.cumsum(s[...,j], axis=-1)
+        departures[...,j] = C + np.maximum.accumulate(prev - (C - s[...,j]), axis=-1)
+        prev = departures[...,j]
+    return departures
+
+def run_sims_single_batch(N=100, p_want=.8, n_people=100, n_dishes=6, rng=None):
+    """Simulate N runs of the single queue buffet at once.
+
+    This draws the same random quantities as `init_dishes_people` for
+    all runs, computes departures with `single_queue_departures`, and
+    returns the same list of dicts as `run_sims`.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    dish_speed = rng.gamma(10, .1, size=(N, n_dishes))
+    person_speed = rng.gamma(10, .1, size=(N, n_people))
+    wants = rng.random((N, n_people, n_dishes)) < p_want
+    serving = rng.lognormal(0, 1, size=(N, n_people, n_dishes)) \
+              * person_speed[:,:,None] * dish_speed[:,None,:]
+    serving[~wants] = 0
+    departures = single_queue_departures(serving)
+    # Each person is done after their last wanted dish, and people who
+    # don't want anything never wait.
+    waits = np.max(np.where(wants, departures, 0), axis=-1)
+    quarts = np.quantile(waits, [.25, .5, .75], axis=1)
+    return [{"max_wait": waits[i].max(),
+             "min_wait": waits[i].min(),
+             "mean_wait": waits[i].mean(),
+             "median_wait": quarts[1,i],
+             "1st_quart_wait": quarts[0,i],
+             "3rd_quart_wait": quarts[2,i],
+             "fastest_dish_speed": dish_speed[i].min(),
+             "slowest_dish_speed": dish_speed[i].max(),
+             "mean_dish_speed": dish_speed[i].mean(),
+             "slowest_person_speed": (1/person_speed[i]).min(),
+             "mean_person_speed": (1/person_speed[i]).mean(),
+             "p_want": p_want,
+             "run_func": "single",
+            } for i in range(0, N)]
+
+# Simulation functions for each buffet type.  "event" is exact and
+# much faster; "timestep" is the original polling simulation, which
+# rounds completion times up to a multiple of TIMESTEP.  "array" is
+# the event simulation on a BuffetState instead of objects, which
+# uses much less memory for large buffets.
+ENGINES = {"event": {"separate": run_separate_queues_events,
+                     "single": run_single_queue_events},
+           "timestep": {"separate": run_separate_queues,
+                        "single": run_single_queue},
+           "array": {"separate": run_separate_queues_state,
+                     "single": run_single_queue_state}}
+
+def simulate(run_func="separate", p_want=.8, n_people=100, n_dishes=6, engine="event", rng=None, tie_break="first"):
+    """Initialise and run a single simulation with the given buffet type
+    and engine.  Returns a tuple of (dishes, people).  See
+    `init_dishes_people` for `rng`.
+
+    In the separate queue buffet, ties between equally short queues are
+    broken by `tie_break` (see ShortestQueueIndex), using `rng` if it
+    is "random".  The timestep engine only supports "first".
+    """
+    f = ENGINES[engine][run_func]
+    kwargs = {}
+    if run_func == "separate":
+        if engine == "timestep":
+            if tie_break != "first":
+                raise ValueError("The timestep engine only supports tie_break=\"first\"")
+        else:
+            kwargs = {"tie_break": tie_break, "rng": rng}
+    if engine == "array":
+        return f(init_state(p_wanted=p_want, n_people=n_people, n_dishes=n_dishes, rng=rng), **kwargs)
+    return f(*init_dishes_people(p_wanted=p_want, n_people=n_people, n_dishes=n_dishes, rng=rng), **kwargs)
+
+class RunningStats:
+    """The count, mean, variance, minimum and maximum of a stream of
+    numbers, in constant memory.
+
+    Values are added in batches and combined with the parallel form of
+    Welford's algorithm (Chan et al.), which is also how two
+    RunningStats objects are merged.
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.
+        self.m2 = 0. # Sum of squared deviations from the mean
+        self.min = np.inf
+        self.max = -np.inf
+    def add(self, x):
+        """Add a number or an array of numbers."""
+        x = np.asarray(x, dtype=float).ravel()
+        if len(x) == 0:
+            return
+        batch = RunningStats()
+        batch.count = len(x)
+        batch.mean = x.mean()
+        batch.m2 = np.sum((x-batch.mean)**2)
+        batch.min = x.min()
+        batch.max = x.max()
+        self.merge(batch)
+    def merge(self, other):
+        """Add all of the values summarised by RunningStats `other`."""
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count/count
+        self.m2 += other.m2 + delta**2 * self.count*other.count/count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+    @property
+    def var(self):
+        return self.m2/(self.count-1) if self.count > 1 else np.nan
+    @property
+    def sem(self):
+        return np.sqrt(self.var/self.count)
+
+class QuantileSketch:
+    """Approximate quantiles of a stream of numbers, in bounded memory.
+
+    This is a merging t-digest (Dunning and Ertl): values are
+    summarised by weighted centroids, each of which spans at most one
+    unit of both the k1 scale function (which keeps centroids small
+    in the middle) and the k2 scale function, k(q) = compression/Z *
+    log(q/(1-q)).  Since k2 grows without bound at both ends,
+    centroids shrink towards the tails, down to single values at the
+    extremes, so extreme quantiles stay accurate.  There are never
+    more than about `compression` centroids.  Two sketches are merged
+    by compressing their centroids together, so sketches from parallel
+    workers can be combined.
+    """
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+        self.min = np.inf
+        self.max = -np.inf
+        # Uncompressed (means, weights) added since the last compress
+        self._buffer = []
+        self._n_buffer = 0
+    @property
+    def count(self):
+        return self.weights.sum() + sum(w.sum() for _,w in self._buffer)
+    def add(self, x):
+        """Add a number or an array of numbers."""
+        x = np.asarray(x, dtype=float).ravel()
+        if len(x) == 0:
+            return
+        self.min = min(self.min, x.min())
+        self.max = max(self.max, x.max())
+        self._push(x, np.ones(len(x)))
+    def merge(self, other):
+        """Add all of the values summarised by QuantileSketch `other`."""
+        other.compress()
+        if len(other.means) == 0:
+            return
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._push(other.means, other.weights)
+    def _push(self, means, weights):
+        self._buffer.append((means, weights))
+        self._n_buffer += len(means)
+        if self._n_buffer > 10*self.compression:
+            self.compress()
+    def compress(self):
+        """Merge buffered values into the centroids."""
+        if not self._buffer:
+            return
+        means = np.concatenate([self.means] + [m for m,_ in self._buffer])
+        weights = np.concatenate([self.weights] + [w for _,w in self._buffer])
+        self._buffer = []
+        self._n_buffer = 0
+        order = np.argsort(means, kind="stable")
+        means = means[order].tolist()
+        weights = weights[order].tolist()
+        total = sum(weights)
+        # A centroid starting at quantile q may extend to q_limit(q),
+        # where k(q_limit) = k(q) + 1, for both k1 and k2.  For k2 this
+        # is q*c/(1-q+q*c).
+        k1 = lambda q : self.compression/(2*np.pi) * np.arcsin(2*q-1)
+        k1_inv = lambda kk : (np.sin(min(kk, self.compression/4)*2*np.pi/self.compression)+1)/2
+        Z = 4*np.log(max(total/self.compression, 1)) + 24
+        c = np.exp(Z/self.compression)
+        q_limit = lambda q : min(k1_inv(k1(q)+1), q*c/(1-q+q*c))
+        new_means = [means[0]]
+        new_weights = [weights[0]]
+        q_done = 0
+        limit = q_limit(q_done)
+        for m,w in zip(means[1:], weights[1:]):
+            if q_done + (new_weights[-1]+w)/total <= limit:
+                new_means[-1] += (m-new_means[-1])*w/(new_weights[-1]+w)
+                new_weights[-1] += w
+            else:
+                q_done += new_weights[-1]/total
+                limit = q_limit(q_done)
+                new_means.append(m)
+                new_weights.append(w)
+        self.means = np.asarray(new_means)
+        self.weights = np.asarray(new_weights)
+    def _quantile(self, q):
+        """Estimate a single quantile `q`.
+
+        Each centroid's values are assumed to be spread evenly around
+        its mean, so we interpolate between the centers of neighbouring
+        centroids, except that a centroid of weight 1 is a single value,
+        which is exact.  Beyond the centers of the first and last
+        centroids, interpolate to the exact min and max, which hold one
+        unit of weight each.
+        """
+        means, weights = self.means, self.weights
+        total = weights.sum()
+        index = q*total
+        if index < 1:
+            return self.min
+        if index > total - 1:
+            return self.max
+        if weights[0] > 1 and index < weights[0]/2:
+            return self.min + (index-1)/(weights[0]/2-1) * (means[0]-self.min)
+        if weights[-1] > 1 and total-index <= weights[-1]/2:
+            return self.max - (total-index-1)/(weights[-1]/2-1) * (self.max-means[-1])
+        done = weights[0]/2
+        for i in range(0, len(means)-1):
+            dw = (weights[i]+weights[i+1])/2
+            if done + dw > index:
+                left = right = 0
+                if weights[i] == 1:
+                    if index - done < .5:
+                        return means[i]
+                    left = .5
+                if weights[i+1] == 1:
+                    if done + dw - index <= .5:
+                        return means[i+1]
+                    right = .5
+                z1 = index - done - left
+                z2 = done + dw - index - right
+                return (means[i]*z2 + means[i+1]*z1)/(z1+z2)
+            done += dw
+        return self.max
+    def quantile(self, q):
+        """Estimate the quantile(s) `q`, between 0 and 1."""
+        self.compress()
+        if len(self.means) == 0:
+            return np.full(np.shape(q), np.nan)
+        return np.vectorize(self._quantile, otypes=[float])(q)
+
+class StatsCollector:
+    """Streaming summaries of named quantities.
+
+    Each name (any hashable, e.g. "mean_wait") gets a RunningStats and
+    a QuantileSketch, so memory is bounded by the number of names, not
+    the number of values.  Collectors can be merged.
+    """
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.moments = {}
+        self.sketches = {}
+    def add(self, name, x):
+        """Add a number or array of numbers `x` to quantity `name`."""
+        if name not in self.moments:
+            self.moments[name] = RunningStats()
+            self.sketches[name] = QuantileSketch(self.compression)
+        self.moments[name].add(x)
+        self.sketches[name].add(x)
+    def merge(self, other):
+        """Add everything summarised by StatsCollector `other`."""
+        for name in other.moments.keys():
+            if name not in self.moments:
+                self.moments[name] = RunningStats()
+                self.sketches[name] = QuantileSketch(self.compression)
+            self.moments[name].merge(other.moments[name])
+            self.sketches[name].merge(other.sketches[name])
+    def compress(self):
+        """Compress all sketches, e.g. before sending to another process."""
+        for sketch in self.sketches.values():
+            sketch.compress()
+    def summary(self):
+        """Return a dict mapping each name to a dict of its statistics."""
+        out = {}
+        for name,m in self.moments.items():
+            quarts = self.sketches[name].quantile([.25, .5, .75])
+            out[name] = {"count": m.count, "mean": m.mean, "sem": m.sem,
+                         "std": np.sqrt(m.var), "min": m.min, "max": m.max,
+                         "1st_quart": quarts[0], "median": quarts[1], "3rd_quart": quarts[2]}
+        return out
+
+def summarize_run(DISHES, PEOPLE, run_func, p_want):
+    """Compute summary statistics for a single simulation run."""
+    waits = np.fromiter((p.total_waiting_time for p in PEOPLE), dtype=float, count=len(PEOPLE))
+    dish_speeds = np.fromiter((d.speed for d in DISHES), dtype=float, count=len(DISHES))
+    inv_speeds = 1/np.fromiter((p.speed for p in PEOPLE), dtype=float, count=len(PEOPLE))
+    quarts = np.quantile(waits, [.25, .5, .75])
+    return {"max_wait": waits.max(),
+            "min_wait": waits.min(),
+            "mean_wait": waits.mean(),
+            "median_wait": quarts[1],
+            "1st_quart_wait": quarts[0],
+            "3rd_quart_wait": quarts[2],
+            "fastest_dish_speed": dish_speeds.min(),
+            "slowest_dish_speed": dish_speeds.max(),
+            "mean_dish_speed": dish_speeds.mean(),
+            "slowest_person_speed": inv_speeds.min(),
+            "mean_person_speed": inv_speeds.mean(),
+            "p_want": p_want,
+            "run_func": run_func,
+    }
+
+def summarize_people(DISHES, PEOPLE, run_func, p_want):
+    """List (speed, # dishes wanted, buffet type, waiting time) for each
+    person in a single simulation run."""
+    return [(p.speed, len(p.wanted), run_func, p.total_waiting_time) for p in PEOPLE]
+
+def summarize_stream(DISHES, PEOPLE, run_func, p_want):
+    """Summarise a single run as a StatsCollector, for `collect_sims`.
+
+    Each numeric statistic from `summarize_run` is recorded under its
+    own name.  Each person's total waiting time is recorded under
+    "person_wait", and also under ("person_wait", k) where k is the
+    number of dishes they wanted.
+    """
+    collector = StatsCollector()
+    for k,v in summarize_run(DISHES, PEOPLE, run_func, p_want).items():
+        if k not in ["p_want", "run_func"]:
+            collector.add(k, v)
+    waits = np.fromiter((p.total_waiting_time for p in PEOPLE), dtype=float, count=len(PEOPLE))
+    n_wanted = np.fromiter((len(p.wanted) for p in PEOPLE), dtype=int, count=len(PEOPLE))
+    collector.add("person_wait", waits)
+    for k in np.unique(n_wanted):
+        collector.add(("person_wait", int(k)), waits[n_wanted==k])
+    collector.compress()
+    return collector
+
+def _replicate(task):
+    """Run a single replication.  This is the unit of work sent to each
+    worker process by `iter_runs`, so it must be a top-level function.
+
+    `task` is a tuple of (run index, SeedSequence or None, summary
+    function, buffet type, engine, p_want, n_people, n_dishes, tie
+    break).  Returns the run index and the output of the summary
+    function.
+    """
+    i, seed, summarize, run_func, engine, p_want, n_people, n_dishes, tie_break = task
+    DISHES, PEOPLE = simulate(run_func, p_want=p_want, n_people=n_people, n_dishes=n_dishes,
+                              engine=engine, rng=np.random.default_rng(seed), tie_break=tie_break)
+    return (i, summarize(DISHES, PEOPLE, run_func, p_want))
+
+def iter_runs(summarize, run_func="separate", N=100, p_want=.8, n_people=100, n_dishes=6, engine="event", seed=None, workers=1, tie_break="first"):
+    """Simulate N runs, yielding (run index, summary) as each finishes.
+
+    `summarize` is a function like `summarize_run` which takes the
+    simulated dishes, people, buffet type, and p_want.  If `workers`
+    is greater than 1, runs are spread across that many processes
+    (None means one per CPU), so results arrive out of order.
+
+    Each run gets its own numpy Generator spawned from `seed` with
+    numpy.random.SeedSequence, which is also used for random tie breaks
+    (see `simulate` for `tie_break`), so results only depend on `seed`
+    and not on the number of workers.  Random quantities are drawn in bulk
+    with `sample_buffet`, which doesn't go through the contract checked
+    samplers (see `set_contract_checks`), so there is no checking
+    overhead.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(N)
+    tasks = [(i, seeds[i], summarize, run_func, engine, p_want, n_people, n_dishes, tie_break)
+             for i in range(0, N)]
+    if workers == 1:
+        for task in tasks:
+            print("Running %i" % task[0])
+            yield _replicate(task)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        for future in concurrent.futures.as_completed([pool.submit(_replicate, t) for t in tasks]):
+            yield future.result()
+
+def run_sims(run_func="separate", N=100, p_want=.8, n_people=100, n_dishes=6, engine="event", seed=None, workers=1, tie_break="first"):
+    """Simulate many runs and collect the results into a dict for simple analysis.
+
+    `run_func` is the buffet type ("separate" or "single") and
+    `engine` is the simulation method to use (a key of ENGINES).  The
+    single queue buffet may also use engine="batch", which simulates
+    all runs at once with `run_sims_single_batch`.  See `iter_runs`
+    for `seed` and `workers`, and `simulate` for `tie_break`.
+    """
+    if engine == "batch":
+        if run_func != "single":
+            raise ValueError("The batch engine only supports the single queue buffet")
+        return run_sims_single_batch(N=N, p_want=p_want, n_people=n_people, n_dishes=n_dishes,
+                                     rng=np.random.default_rng(seed))
+    runs = sorted(iter_runs(summarize_run, run_func=run_func, N=N, p_want=p_want, n_people=n_people,
+                            n_dishes=n_dishes, engine=engine, seed=seed, workers=workers,
+                            tie_break=tie_break),
+                  key=lambda r : r[0])
+    return [stats for _,stats in runs]
+
+def run_sims_people(run_func="separate", N=100, p_want=.8, n_people=100, n_dishes=6, engine="event", seed=None, workers=1, tie_break="first"):
     """Simulate many times and create statistics on the number of people.
 
     This is an alternative to run_sims, except it tabulates for
     individual people.  It also returns a DataFrame.
     """
-    f = run_separate_queues if run_func == "separate" else run_single_queue if run_func == "single" else None
+    import pandas
     people = [] # run, speed, waiting time
-    for i in range(0, N):
-        print("Running %i" % i)
-        DISHES, PEOPLE = f(*init_dishes_people(p_wanted=p_want, n_people=n_people, n_dishes=n_dishes))
-        for p in PEOPLE:
-            people.append((i, p.speed, len(p.wanted), run_func, p.total_waiting_time))
+    for i,rows in iter_runs(summarize_people, run_func=run_func, N=N, p_want=p_want, n_people=n_people,
+                            n_dishes=n_dishes, engine=engine, seed=seed, workers=workers,
+                            tie_break=tie_break):
+        people.extend((i,)+row for row in rows)
+    people.sort(key=lambda row : row[0])
     return pandas.DataFrame(people, columns=["run_id", "Speed", "# dishes wanted", "Buffet type", "Total waiting time"])
 
-# Look at simulations in which we keep track of people instead of
-# entire runs.
-sep = run_sims_people("separate", N=30)
-single = run_sims_people("single", N=30)
-peo = pandas.concat([sep, single])
-
-# Get rid of people who only want one dish, as there are not very many
-# of them so it is mostly noise.
-peo = peo[peo["# dishes wanted"] > 1]
-
-# Plot the wait time for people who want different numbers of dishes.
-sns.barplot(data=peo, x="Buffet type", y="Total waiting time", hue="# dishes wanted")
-plt.savefig("fairness.png")
-plt.show()
-
-# Examine how an individual's speed compares to their waiting time.
-plt.figure(figsize=(4,4))
-sns.scatterplot(data=peo.sample(frac=1), x="Speed", y="Total waiting time", hue="Buffet type", markers=".", s=8, ax=plt.gca())
-sns.despine()
-plt.tight_layout()
-plt.savefig("speed-vs-time.png")
-plt.show()
-# Show they are not correlated.
-scipy.stats.spearmanr(peo['Speed'], peo['Total waiting time'])
+def collect_sims(run_func="separate", N=100, p_want=.8, n_people=100, n_dishes=6, engine="event", seed=None, workers=1, tie_break="first"):
+    """Simulate many runs and aggregate them into a single StatsCollector.
+
+    Unlike `run_sims` and `run_sims_people`, this keeps neither the
+    per-run dicts nor the per-person rows, so memory does not grow
+    with N or n_people.  Each run (possibly in a worker process, see
+    `iter_runs`) is summarised by `summarize_stream`, and the results
+    are merged as they arrive.
+    """
+    collector = StatsCollector()
+    for _,c in iter_runs(summarize_stream, run_func=run_func, N=N, p_want=p_want, n_people=n_people,
+                         n_dishes=n_dishes, engine=engine, seed=seed, workers=workers,
+                         tie_break=tie_break):
+        collector.merge(c)
+    return collector
+
+def sweep(run_func=("separate", "single"), p_want=(.8,), n_dishes=(6,), n_people=(100,), N=100, seed=0, engine="event", workers=1, cache_dir="cache", tie_break="first"):
+    """Run `run_sims` for every combination of the parameters.
+
+    `run_func`, `p_want`, `n_dishes` and `n_people` are lists (or
+    tuples) of values to try.  Returns a list of the dicts from `run_sims` for
+    all cells of the grid, with "n_dishes" and "n_people" added.
+
+    Each cell is cached in `cache_dir` (None to disable) as a JSON
+    file, keyed on its parameters, N, `seed`, `engine` and `tie_break`
+    (see `simulate`), so changing one cell only re-simulates that cell.  Since every cell uses the
+    same `seed`, cells share random numbers as far as possible (common
+    random numbers), which makes differences between cells less noisy.
+    Results with seed=None are random, so they are never cached.
+    """
+    runs = []
+    for rf,pw,nd,npeople in itertools.product(run_func, p_want, n_dishes, n_people):
+        params = {"run_func": rf, "p_want": pw, "n_dishes": nd, "n_people": npeople,
+                  "N": N, "seed": seed, "engine": engine, "tie_break": tie_break}
+        key = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+        filename = None if cache_dir is None or seed is None else os.path.join(cache_dir, "buffet-%s.json" % key)
+        if filename is not None and os.path.exists(filename):
+            with open(filename, "r") as f:
+                cell = json.load(f)["runs"]
+        else:
+            cell = run_sims(rf, N=N, p_want=pw, n_people=npeople, n_dishes=nd, engine=engine,
+                            seed=seed, workers=workers, tie_break=tie_break)
+            cell = [{k : (v if isinstance(v, str) else float(v)) for k,v in r.items()} for r in cell]
+            if filename is not None:
+                os.makedirs(cache_dir, exist_ok=True)
+                with open(filename, "w") as f:
+                    json.dump({"params": params, "runs": cell}, f)
+        runs.extend(dict(r, n_dishes=nd, n_people=npeople) for r in cell)
+    return runs
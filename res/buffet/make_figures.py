@@ -0,0 +1,80 @@
+# Figures for "Are buffets efficient?"
+# Copyright 2019 Max Shinn <max@maxshinnpotential.com>
+
+import os
+import scipy.stats
+import pandas
+import matplotlib.pyplot as plt
+import seaborn as sns
+from buffet_model import sweep, run_sims_people
+
+def plot_wait_inequality(df, filename):
+    """Bar plots of mean wait time and inequality (interquartile range
+    of wait times) by buffet type and probability of wanting a dish,
+    for a DataFrame of runs from `sweep` or `run_sims`."""
+    pal = sns.color_palette()
+    df = df.copy()
+    # Create more sensible names for the columns
+    df["Inequality"] = df["3rd_quart_wait"] - df["1st_quart_wait"]
+    df.rename(columns={'p_want': 'Probability of wanting a dish',
+                       'mean_wait': 'Mean wait time',
+                       'run_func': 'Buffet type'}, inplace=True)
+    ax = plt.subplot(2,1,1)
+    agg = df.groupby(["Buffet type", "Probability of wanting a dish"])["Mean wait time"].agg(["mean", scipy.stats.sem])
+    agg['mean'].unstack(0).plot(kind='bar', yerr=agg['sem'].unstack(0), ax=ax, rot=0, color=pal)
+    plt.xlabel("")
+    plt.ylabel("Mean wait time")
+    ax = plt.subplot(2,1,2)
+    agg = df.groupby(["Buffet type", "Probability of wanting a dish"])["Inequality"].agg(["mean", scipy.stats.sem])
+    agg['mean'].unstack(0).plot(kind='bar', yerr=agg['sem'].unstack(0), ax=ax, rot=0, color=pal)
+    plt.ylabel("Inequality")
+    ax.get_legend().remove()
+    plt.tight_layout()
+    plt.savefig(filename)
+    plt.show()
+
+
+if __name__ == "__main__":
+    # Simulate in parallel with one process per CPU
+    WORKERS = os.cpu_count()
+
+    # Simulate for different probabilities of wanting a given dish
+    df = pandas.DataFrame(sweep(p_want=[.8, .3, 1], workers=WORKERS))
+    plot_wait_inequality(df, "wait-ineq-few-dishes.png")
+
+    # Repeat all of the above, but for many dishes
+    dfmd = pandas.DataFrame(sweep(p_want=[.1, .2, .3, .4], n_dishes=[20], workers=WORKERS))
+    plot_wait_inequality(dfmd, "wait-ineq-many-dishes.png")
+
+    # Repeat all of the above, but for many people
+    dfmp = pandas.DataFrame(sweep(p_want=[.8, .3, 1], n_people=[500], workers=WORKERS))
+    plot_wait_inequality(dfmp, "wait-ineq-many-people.png")
+
+    # Repeat all of the above, but for many very few people
+    dffp = pandas.DataFrame(sweep(p_want=[.8, .3, 1], n_people=[30], workers=WORKERS))
+    plot_wait_inequality(dffp, "wait-ineq-veryfew-people.png")
+
+    # Look at simulations in which we keep track of people instead of
+    # entire runs.
+    sep = run_sims_people("separate", N=30, workers=WORKERS)
+    single = run_sims_people("single", N=30, workers=WORKERS)
+    peo = pandas.concat([sep, single])
+
+    # Get rid of people who only want one dish, as there are not very many
+    # of them so it is mostly noise.
+    peo = peo[peo["# dishes wanted"] > 1]
+
+    # Plot the wait time for people who want different numbers of dishes.
+    sns.barplot(data=peo, x="Buffet type", y="Total waiting time", hue="# dishes wanted")
+    plt.savefig("fairness.png")
+    plt.show()
+
+    # Examine how an individual's speed compares to their waiting time.
+    plt.figure(figsize=(4,4))
+    sns.scatterplot(data=peo.sample(frac=1), x="Speed", y="Total waiting time", hue="Buffet type", markers=".", s=8, ax=plt.gca())
+    sns.despine()
+    plt.tight_layout()
+    plt.savefig("speed-vs-time.png")
+    plt.show()
+    # Show they are not correlated.
+    scipy.stats.spearmanr(peo['Speed'], peo['Total waiting time'])
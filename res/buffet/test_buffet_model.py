@@ -0,0 +1,24 @@
+# Tests for buffet_model.py, run with pytest
+# Copyright 2019 Max Shinn <max@maxshinnpotential.com>
+
+import numpy as np
+import buffet_model as bm
+
+def test_quantile_sketch_tails():
+    """Tail quantiles of a skewed distribution are accurate, including
+    after merging sketches."""
+    x = np.random.default_rng(0).lognormal(0, 1, 200000)
+    qs = [.001, .01, .25, .5, .75, .99, .999, .9999]
+    true = np.quantile(x, qs)
+    sketch = bm.QuantileSketch()
+    for chunk in np.array_split(x, 200):
+        sketch.add(chunk)
+    merged = bm.QuantileSketch()
+    for chunk in np.array_split(x, 8):
+        part = bm.QuantileSketch()
+        part.add(chunk)
+        merged.merge(part)
+    for s in [sketch, merged]:
+        assert np.all(np.abs(s.quantile(qs)/true - 1) < .02)
+        assert s.quantile(0) == x.min() and s.quantile(1) == x.max()
+        assert len(s.means) <= s.compression
@@ -1,16 +1,24 @@
-import random
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy, scipy
 import math
 
-# Allow our recursive function
-import sys
-sys.setrecursionlimit(10001)
+# Binary sequences are numpy uint8 arrays of 0's and 1's.  Functions
+# accept lists, strings, or arrays, and return arrays.
+
+# Length above which `autocorrelate` uses the FFT
+FFT_THRESHOLD = 2048
+
+def as_sequence(ts):
+    """Convert a binary sequence from a list, string, or array to a
+    uint8 array."""
+    if isinstance(ts, str):
+        return numpy.frombuffer(ts.encode(), dtype=numpy.uint8) - ord("0")
+    return numpy.asarray(ts, dtype=numpy.uint8)
 
 def asstring(ts):
-    """Convert a binary sequence from a list to a string."""
-    return "".join([str(i) for i in ts])
+    """Convert a binary sequence from a list or array to a string."""
+    return (as_sequence(ts) + ord("0")).tobytes().decode()
 
 def ordinal(num):
     """Convert n integer to its linguistic ordinal form (a string)."""
@@ -25,21 +33,56 @@ def ordinal(num):
 
 def mean(x):
     "Find the mean (symbol probability) of a binary sequence."
-    return sum([int(i) for i in x])/len(x)
+    return numpy.mean(as_sequence(x))
 
 def diff(ts):
     """Return the 1st difference sequence of the binary sequence `ts`."""
-    outputts = []
-    for i in range(0, len(ts)-1):
-        outputts.append(int(ts[i] != ts[i+1]))
-    return outputts
+    ts = as_sequence(ts)
+    return ts[:-1] ^ ts[1:]
 
 def nthdiff(ts, n):
-    """Return the `n`'th difference sequence of binary sequence `ts`."""
-    if n == 0:
-        return ts
-    else:
-        return nthdiff(diff(ts), n-1)
+    """Return the `n`'th difference sequence of binary sequence `ts`.
+
+    Mod 2, element i of the n'th difference is the XOR of ts[i+k] for
+    each k where C(n, k) is odd.  By Lucas's theorem, (1+x)^n = the
+    product of (1+x^(2^b)) for each bit b set in n, so instead of
+    taking n differences, take one difference with a step of 2^b for
+    each set bit.
+    """
+    ts = as_sequence(ts)
+    b = 0
+    while n >> b:
+        if (n >> b) & 1:
+            step = 1 << b
+            ts = ts[:-step] ^ ts[step:] if step < len(ts) else ts[0:0]
+        b += 1
+    return ts
+
+def nthdiffs(ts, orders):
+    """Return the difference sequences of `ts` of each order in
+    `orders`, in the same order.  Higher orders are computed from the
+    next lowest, so e.g. the 65th difference only needs the 1st
+    difference of the 64th."""
+    ts = as_sequence(ts)
+    out = {}
+    prev, prev_ts = 0, ts
+    for n in sorted(set(orders)):
+        prev_ts = nthdiff(prev_ts, n-prev)
+        prev = n
+        out[n] = prev_ts
+    return [out[n] for n in orders]
+
+def nthdiff_means(generate, ps, n_diffs, repeats=5):
+    """For each switch probability in `ps`, generate `repeats`
+    sequences with `generate` (a function of the switch probability),
+    and find the mean of each order of difference in `n_diffs`.
+    Returns an array indexed by [difference, repeat, switch
+    probability]."""
+    means = numpy.zeros((len(n_diffs), repeats, len(ps)))
+    for i in range(0, repeats):
+        for j,p in enumerate(ps):
+            means[:,i,j] = [mean(d) for d in nthdiffs(generate(p), n_diffs)]
+    return means
 
 def integrate(ts, start=0):
     """Return  the first integral sequence of the binary sequence `ts`.
@@ -48,86 +91,167 @@ def integrate(ts, start=0):
     that would have that diff.  The first digit should be `start`,
     which should have a value of 0 or 1.
     """
-    outputts = [start]
-    for e in ts:
-        outputts.append(int(bool(int(e)) != bool(int(outputts[-1])))) # XOR
-    return outputts
+    ts = as_sequence(ts)
+    return numpy.concatenate([[start], start ^ numpy.bitwise_xor.accumulate(ts)]).astype(numpy.uint8)
 
-def human_random(l=1000, switch_prob=.5):
+def human_random(l=1000, switch_prob=.5, start=None):
     """Generate a human-like random binary sequence.
 
     Humans tend to have a higher than average switch probability.
     Here, generate a sequence of length `l` with a switch probability
     of `switch_prob`.  When `switch_prob` = 5, this is a typical
-    pseudo-random sequence.
+    pseudo-random sequence.  The first element is `start`, or random
+    if `start` is None.
     """
-    ts = [random.randint(0, 1)]
-    for i in range(0, l-1):
-        if random.random() > switch_prob:
-            ts.append(ts[i])
-        else:
-            ts.append(1-ts[i])
-    return ts
+    switches = numpy.random.random(l-1) <= switch_prob
+    return integrate(switches, numpy.random.randint(0, 2) if start is None else start)
 
-def autocorrelate(ts):
-    """Find the autocorelation of the binary sequence `ts`."""
-    # Convert to correct datatype (int for binary sequences)
-    ts = list(map(int, ts))
-    # Autocorrelation function shortcut w/ numpy
-    acf = numpy.correlate(ts, ts, mode="full")
+def autocorrelate(ts, max_lag=None):
+    """Find the autocorelation of the binary sequence `ts`, for lags 0
+    to `max_lag` (by default, every lag).
+
+    `ts` may also be a 2-D array of sequences of the same length, one
+    per row, giving one autocorrelation per row.  Long sequences (more
+    than FFT_THRESHOLD elements) use the FFT.
+    """
+    ts = as_sequence(ts)
+    L = ts.shape[-1]
+    max_lag = L-1 if max_lag is None else min(max_lag, L-1)
+    if L > FFT_THRESHOLD:
+        # Zero pad so that the circular correlation doesn't wrap around
+        # for the lags we want.  Counts are integers, so round off the
+        # floating point error.
+        n = 2**int(math.ceil(math.log2(L+max_lag)))
+        f = numpy.fft.rfft(ts, n, axis=-1)
+        acf = numpy.rint(numpy.fft.irfft(f*numpy.conj(f), n, axis=-1)[...,0:max_lag+1])
+    else:
+        ts = ts.astype(int)
+        acf = numpy.stack([numpy.sum(ts[...,0:L-k]*ts[...,k:], axis=-1) for k in range(0, max_lag+1)], axis=-1)
     # Normalize by size of overlap
-    normfactor = list(range(1, len(ts))) + list(range(len(ts), 0, -1))
-    acf = acf/normfactor
-    return acf[acf.size//2:]
+    return acf/(L - numpy.arange(0, max_lag+1))
 
-def nthentropy(s, o=1):
-    # Convert `s` to a string
-    s = "".join(map(str, s))
-    # Pad the string to make an even multiple of the code length
-    while len(s) % o != 0: s = s + "0"
-    # Split into codewords
-    codewords = [s[i*o:i*o+o] for i in range(0, len(s)//o)]
-    # Find codeword frequencies
-    freqs = { c : codewords.count(c)/len(codewords) for c in set(codewords) }
-    # And return entropy
-    _H = lambda x : - x * math.log2(x)
-    return sum(map(_H, freqs.values()))
+def window_codes(s, o):
+    """Pack the `o` elements starting at each position of binary
+    sequence `s` into an integer, first element in the highest bit.
+    `s` is padded at the end with zeros so there is a code for every
+    position.  Codes are 64 bit, so `o` can be at most 64."""
+    if o > 64:
+        raise ValueError("Windows longer than 64 elements do not fit in an integer")
+    s = numpy.concatenate([as_sequence(s), numpy.zeros(o-1, dtype=numpy.uint8)])
+    n = len(s) - o + 1
+    codes = numpy.zeros(n, dtype=numpy.uint64 if o > 8 else numpy.uint8)
+    for j in range(0, o):
+        codes = (codes << 1) | s[j:j+n]
+    return codes
+
+def _entropy(codes):
+    """Entropy (in bits) of the distribution of `codes`, which are
+    integers, or for codewords too long for an integer, rows of packed
+    bytes."""
+    if len(codes) == 0:
+        return 0
+    if codes.ndim == 1 and codes.max() < 2**20:
+        counts = numpy.bincount(codes.astype(numpy.int64))
+        counts = counts[counts > 0]
+    else:
+        counts = numpy.unique(codes, axis=0, return_counts=True)[1]
+    p = counts/len(codes)
+    return -numpy.sum(p*numpy.log2(p))
+
+def _order_codes(codes, L, o, sliding):
+    """From the window codes of a sequence of length `L`, select the
+    codewords of length `o`: every window if `sliding`, otherwise
+    non-overlapping blocks."""
+    if sliding:
+        return codes[0:max(L-o+1, 0)]
+    return codes[0:L:o]
+
+def nthentropy(s, o=1, sliding=False):
+    """Entropy of the codewords of length `o` in binary sequence `s`.
+
+    By default, split `s` into blocks of length `o`, padding the end
+    with zeros.  If `sliding` is True, use every window of length `o`
+    instead.
+    """
+    L = len(s)
+    if o <= 64 or L == 0:
+        return _entropy(_order_codes(window_codes(s, min(o, 64)), L, o, sliding))
+    # Too long for an integer, so pack each codeword into bytes
+    padded = numpy.concatenate([as_sequence(s), numpy.zeros(o-1, dtype=numpy.uint8)])
+    windows = numpy.lib.stride_tricks.sliding_window_view(padded, o)
+    return _entropy(numpy.packbits(_order_codes(windows, L, o, sliding), axis=1))
+
+def entropies(s, orders=range(1, 9), sliding=False):
+    """`nthentropy` of `s` for each order in `orders`.  The codeword of
+    each order up to 8 is the first bits of the 8-element window code,
+    so these all come from a single pass over `s`."""
+    L = len(s)
+    codes8 = window_codes(s, 8)
+    out = []
+    for o in orders:
+        if o <= 8:
+            out.append(_entropy(_order_codes(codes8 >> (8-o), L, o, sliding)))
+        else:
+            out.append(nthentropy(s, o, sliding))
+    return out
 
 def triplet_method(ts, simplify=True):
     """Apply the triplet method (discussed in the blog post) to binary sequence `ts`."""
     # Skip the last few digits if the sequence is not a multiple of
     # three
-    n_triples = int(len(ts)/3)
-    final_ts = []
-    for i in range(0, n_triples):
-        triple = ts[i*3:(i+1)*3]
-        if asstring(diff(triple)) in ["00", "11"]:
-            continue
-        if simplify:
-            final_ts.append(1 if asstring(triple) in ["110", "011"] else 0)
-        else:
-            final_ts.append(1 if asstring(triple) in ["110", "001"] else 0)
-    return final_ts
+    ts = as_sequence(ts)
+    triples = ts[0:3*(len(ts)//3)].reshape(-1, 3)
+    # Skip triples whose diff is "00" or "11", i.e. whose first and
+    # last digits are the same
+    triples = triples[triples[:,0] != triples[:,2]]
+    # What remains is 001, 011, 100, or 110
+    if simplify:
+        return triples[:,1].copy() # 1 for 110 and 011
+    return 1 ^ triples[:,0] ^ triples[:,1] # 1 for 110 and 001
+
+def triplet_stream(switch_prob=.5, chunk_size=65536):
+    """Generate the output of the triplet method lazily, in arrays of
+    about `chunk_size` elements.
 
+    The underlying sequence is a single `human_random` sequence with
+    switch probability `switch_prob`, generated piece by piece with
+    each piece continuing from the last element of the one before, so
+    it truly has the specified switch probability however much output
+    is taken.  A triple is kept when exactly one of its two transitions
+    is a switch, so each element of the underlying sequence gives
+    2p(1-p)/3 output elements on average, and the pieces are sized
+    from this.
+    """
+    yield_rate = 2*switch_prob*(1-switch_prob)/3
+    if yield_rate <= 0:
+        raise ValueError("The triplet method gives no output when switch_prob is 0 or 1")
+    piece_size = 3*int(math.ceil(chunk_size/yield_rate/3))
+    last = None
+    while True:
+        if last is None:
+            piece = human_random(piece_size, switch_prob)
+        else:
+            piece = human_random(piece_size+1, switch_prob, start=last)[1:]
+        last = piece[-1]
+        yield triplet_method(piece)
 
 def triplet_generate(n, switch_prob=.5):
     """Generate a sequence of length `n` using the triplet method.
 
     Rather than applying the triplet method to an existing binary sequence,
-    generate values for a binary sequence until we have one of length `n`.
-
-    We use a cache (with a large cache size) as an easy way to avoid
-    the criticism that the underlying sequence does not truly have the
-    specified switch probability because short sequences are being
-    generated and concatenated, which would no longer share those
-    properties.
+    take output from `triplet_stream` until we have one of length `n`.
+    The amount of output from each chunk varies, with a standard
+    deviation of less than sqrt(n), so ask for a few standard
+    deviations more than `n` to usually only need one chunk.
     """
-    CACHE_SIZE = 900
-    ts = []
-    while len(ts)<n:
-        cache = human_random(CACHE_SIZE, switch_prob)
-        ts.extend(triplet_method(cache))
-    return ts[0:n]
+    chunks = []
+    total = 0
+    for chunk in triplet_stream(switch_prob, chunk_size=min(n + 4*int(math.sqrt(n)) + 1, 65536)):
+        chunks.append(chunk)
+        total += len(chunk)
+        if total >= n:
+            break
+    return numpy.concatenate(chunks)[0:n]
 
 if __name__ == "__main__":
     # CREATE THE FIRST FIGURE
@@ -136,12 +260,8 @@ if __name__ == "__main__":
     sns.set_palette(sns.cubehelix_palette(len(n_diffs)))
     sns.set_context("poster", font_scale=1.5)
     sns.set_style("white")
-    for n_diff in n_diffs:
-        nthdiffmeans_all = []
-        for i in range(0, 5):
-            nthdiffmeans = [mean(nthdiff(human_random(2000, p), n_diff)) for p in ps]
-            nthdiffmeans_all.append(nthdiffmeans)
-        
+    means = nthdiff_means(lambda p : human_random(2000, p), ps, n_diffs)
+    for n_diff,nthdiffmeans_all in zip(n_diffs, means):
         plt.errorbar(ps, numpy.mean(nthdiffmeans_all, axis=0), scipy.stats.sem(nthdiffmeans_all, axis=0), label=ordinal(n_diff)+" difference")
     
     plt.xlabel("Switch probability")
@@ -158,12 +278,8 @@ if __name__ == "__main__":
     sns.set_palette(sns.cubehelix_palette(len(n_diffs)))
     sns.set_context("poster", font_scale=1.5)
     sns.set_style("white")
-    for n_diff in n_diffs:
-        nthdiffmeans_all = []
-        for i in range(0, 5):
-            nthdiffmeans = [mean(nthdiff(human_random(2000, p), n_diff)) for p in ps]
-            nthdiffmeans_all.append(nthdiffmeans)
-        
+    means = nthdiff_means(lambda p : human_random(2000, p), ps, n_diffs)
+    for n_diff,nthdiffmeans_all in zip(n_diffs, means):
         plt.errorbar(ps, numpy.mean(nthdiffmeans_all, axis=0), scipy.stats.sem(nthdiffmeans_all, axis=0), label=ordinal(n_diff)+" difference")
     
     plt.xlabel("Switch probability")
@@ -179,12 +295,8 @@ if __name__ == "__main__":
     sns.set_palette(sns.cubehelix_palette(len(n_diffs)))
     sns.set_context("poster", font_scale=1.5)
     sns.set_style("white")
-    for n_diff in n_diffs:
-        nthdiffmeans_all = []
-        for i in range(0, 5):
-            nthdiffmeans = [mean(nthdiff(triplet_method(human_random(20000, p)), n_diff)) for p in ps]
-            nthdiffmeans_all.append(nthdiffmeans)
-        
+    means = nthdiff_means(lambda p : triplet_method(human_random(20000, p)), ps, n_diffs)
+    for n_diff,nthdiffmeans_all in zip(n_diffs, means):
         plt.errorbar(ps, numpy.mean(nthdiffmeans_all, axis=0), scipy.stats.sem(nthdiffmeans_all, axis=0), label=ordinal(n_diff)+" difference")
     
     plt.xlabel("Switch probability")
@@ -205,38 +317,38 @@ if __name__ == "__main__":
     nth_entropies_all = []
     for i in range(0, 3):
         seq = human_random(20000, .8)
-        nth_entropies = [nthentropy(seq, e)/e for e in n_entropies]
+        nth_entropies = [h/e for h,e in zip(entropies(seq, n_entropies), n_entropies)]
         nth_entropies_all.append(nth_entropies)
     plt.errorbar(n_entropies, numpy.mean(nth_entropies_all, axis=0), scipy.stats.sem(nth_entropies_all, axis=0), label="Human-like", c="k")
     nth_entropies_all = []
     for i in range(0, 3):
         seq = triplet_generate(20000, .8)
-        nth_entropies = [nthentropy(seq, e)/e for e in n_entropies]
+        nth_entropies = [h/e for h,e in zip(entropies(seq, n_entropies), n_entropies)]
         nth_entropies_all.append(nth_entropies)
     plt.errorbar(n_entropies, numpy.mean(nth_entropies_all, axis=0), scipy.stats.sem(nth_entropies_all, axis=0), label="Triplet method", c="g")
     nth_entropies_all = []
     for i in range(0, 3):
         seq = human_random(20000, .5)
-        nth_entropies = [nthentropy(seq, e)/e for e in n_entropies]
+        nth_entropies = [h/e for h,e in zip(entropies(seq, n_entropies), n_entropies)]
         nth_entropies_all.append(nth_entropies)
     plt.errorbar(n_entropies, numpy.mean(nth_entropies_all, axis=0), scipy.stats.sem(nth_entropies_all, axis=0), label="True random", c="r", linestyle="--")
     nth_entropies_all = []
     for i in range(0, 3):
         seq = nthdiff(human_random(20000, .8), 1)
-        nth_entropies = [nthentropy(seq, e)/e for e in n_entropies]
+        nth_entropies = [h/e for h,e in zip(entropies(seq, n_entropies), n_entropies)]
         nth_entropies_all.append(nth_entropies)
     plt.errorbar(n_entropies, numpy.mean(nth_entropies_all, axis=0), scipy.stats.sem(nth_entropies_all, axis=0), label="1st difference", c=[150/255, 50/255, 200/255])
     nth_entropies_all = []
     for i in range(0, 3):
         seq = nthdiff(human_random(20000, .8), 2)
-        nth_entropies = [nthentropy(seq, e)/e for e in n_entropies]
+        nth_entropies = [h/e for h,e in zip(entropies(seq, n_entropies), n_entropies)]
         nth_entropies_all.append(nth_entropies)
     plt.errorbar(n_entropies, numpy.mean(nth_entropies_all, axis=0), scipy.stats.sem(nth_entropies_all, axis=0), label="2nd difference", c=[200/255, 100/255, 250/255])
     for j,n_diff in enumerate(n_diffs):
         nth_entropies_all = []
         for i in range(0, 3):
             seq = nthdiff(human_random(20000, .8), n_diff)
-            nth_entropies = [nthentropy(seq, e)/e for e in n_entropies]
+            nth_entropies = [h/e for h,e in zip(entropies(seq, n_entropies), n_entropies)]
             nth_entropies_all.append(nth_entropies)
         plt.errorbar(n_entropies, numpy.mean(nth_entropies_all, axis=0), scipy.stats.sem(nth_entropies_all, axis=0), label=ordinal(n_diff)+" difference", c=pal1[j])
     pal2 = sns.cubehelix_palette(len(n_diffs_p1), start=2, dark=.4, light=.8)
@@ -246,7 +358,7 @@ if __name__ == "__main__":
         nth_entropies_all = []
         for i in range(0, 3):
             seq = nthdiff(human_random(20000, .8), n_diff)
-            nth_entropies = [nthentropy(seq, e)/e for e in n_entropies]
+            nth_entropies = [h/e for h,e in zip(entropies(seq, n_entropies), n_entropies)]
             nth_entropies_all.append(nth_entropies)
         plt.errorbar(n_entropies, numpy.mean(nth_entropies_all, axis=0), scipy.stats.sem(nth_entropies_all, axis=0), label=ordinal(n_diff)+" difference", c=pal2[j])
     
@@ -6,14 +6,22 @@ import scipy as sp
 import numpy as np
 import scipy.stats
 import itertools
+from riffle_fit import pad_sequences, log_p_riffle_shuffle_batch, log_p_gsr_riffle_shuffle_batch, fit_p_switch, fit_models
+from riffle_store import open_store
 
 # Note that the deck I used to collect these data did not have 52
 # cards.  My only real deck of cards was buried deep in a box
 # somewhere, so I used a "Fact or Crap" card game which was on the top
 # of the box.  Since they were approximately the same size and
 # stiffness, this should not affect results.
-with open("riffle_data.txt", "r") as f:
-    sequences = [[int(e) for e in l.strip()] for l in f.readlines()]
+#
+# The data are read through a bit-packed store (see riffle_store.py),
+# which is only rebuilt when riffle_data.txt changes.  The pure Python
+# models below are only run on the first N_SAMPLE sequences; the
+# pooled fit at the end streams the whole store in batches.
+N_SAMPLE = 1000
+store = open_store("riffle_data.txt")
+sequences = [s.tolist() for s in itertools.islice(store, N_SAMPLE)]
 
 splitsizes = [sum(l)/len(l) for l in sequences]
 
@@ -91,30 +99,29 @@ seq = [0, 1, 1, 0, 1, 0]
 assert round(np.log(p_riffle_shuffle(seq, .8)),10) == round(log_p_riffle_shuffle(seq, .8),10)
 assert round(np.log(p_gsr_riffle_shuffle(seq)),10) == round(log_p_gsr_riffle_shuffle(seq),10)
 
-# Fit the parameter separately for each sequence, and add the
-# probabilities together.
-p_switch_params = []
-log_prob_riffle = []
-log_prob_riffle_gsr = []
-bic_riffle = []
-bic_gsr = []
-for s in sequences:
-    param = sp.optimize.differential_evolution(lambda x : -log_p_riffle_shuffle(s, x), [[0, 1]])
-    p_switch_params.append(param.x[0])
-    log_prob_riffle.append(-param.fun)
-    log_prob_riffle_gsr.append(log_p_gsr_riffle_shuffle(s))
+# The functions above walk through each sequence in Python.  The
+# vectorized versions in riffle_fit.py compute the log probability of
+# every sequence at once.
 
-# Positive numbers in each indicate gsr is worse
-print([r-g for r,g in zip(log_prob_riffle, log_prob_riffle_gsr)])
+data = pad_sequences(sequences)
+assert np.all(data == next(store.iter_batches(N_SAMPLE)))
+assert np.allclose(log_p_riffle_shuffle_batch(data, .3), [log_p_riffle_shuffle(s, .3) for s in sequences])
+assert np.allclose(log_p_gsr_riffle_shuffle_batch(data), [log_p_gsr_riffle_shuffle(s) for s in sequences])
 
-print(p_switch_params)
+# Fit the parameter separately for each sampled sequence, and add the
+# probabilities together.  The maximum likelihood estimate is just the
+# fraction of transitions which are switches.
+p_switch_params, p_switch_se, log_prob_riffle = fit_p_switch(data, pooled=False)
+log_prob_riffle_gsr = log_p_gsr_riffle_shuffle_batch(data)
 
-# Best fit single parameter, all sequences together (as it should be)
-best_param = sp.optimize.differential_evolution(lambda x : -sum([log_p_riffle_shuffle(s, x) for s in sequences]), [[0, 1]])
-aic_riffle = 2 - 2*(-best_param.fun)
-aic_gsr = -2*sum([log_p_gsr_riffle_shuffle(s) for s in sequences])
+# Positive numbers in each indicate gsr is worse
+print(list(log_prob_riffle - log_prob_riffle_gsr))
 
-print("Best parameter: %f" % best_param.x[0])
-print("AIC riffle: %f, AIC GSR: %f" % (aic_riffle, aic_gsr))
+print(list(p_switch_params))
 
+# Best fit single parameter, all sequences together (as it should be)
+fits = fit_models(store.iter_batches())
 
+print("Best parameter: %f (SE %f)" % (fits["riffle"]["p_switch"], fits["riffle"]["se"]))
+print("AIC riffle: %f, AIC GSR: %f" % (fits["riffle"]["aic"], fits["gsr"]["aic"]))
+print("BIC riffle: %f, BIC GSR: %f" % (fits["riffle"]["bic"], fits["gsr"]["bic"]))
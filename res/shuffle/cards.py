@@ -4,29 +4,29 @@
 
 import random
 import collections
-import functools # For file caching
-import dill # For file caching
-import os # For file caching
+import functools
+from filecache import FileCache
 # Cards are in the format (suit, number) where ace == 1, jack == 11,
 # queen == 12, king == 13 and suits are 0-3.
 SUITS = list(range(0, 4))
 RANKS = list(range(1, 14))
 DECK = [(suit, rank) for suit in SUITS for rank in RANKS]
 
-import joblib
-file_cache = joblib.Memory(cachedir="cache", verbose=0)
+file_cache = FileCache("cache")
 
 def get_suit_pattern(hand):
     hand_suit = [s for s,r in hand]
     return tuple(sorted((hand_suit.count(0), hand_suit.count(1), hand_suit.count(2), hand_suit.count(3))))
 
 @file_cache.cache
-def p_suit_distribution(hand_size, niter=1e6):
+def p_suit_distribution(hand_size, niter=1e6, seed=0):
     """Given that a hand consists of `hand_size` cards, calculate the
-    probability of observing a particular distribution of suits."""
+    probability of observing a particular distribution of suits.
+    Hands are sampled with the random seed `seed`."""
+    rng = random.Random(seed)
     sorts = {}
     for i in range(0, int(niter)):
-        hand = random.sample(DECK, hand_size)
+        hand = rng.sample(DECK, hand_size)
         s = get_suit_pattern(hand)
         if s not in sorts.keys():
             sorts[s] = 0
@@ -40,10 +40,11 @@ def get_rank_pattern(hand):
     return tuple(sorted(hand_rank.count(n) for n in RANKS))
 
 @file_cache.cache
-def p_rank_distribution(hand_size, niter=1e6):
+def p_rank_distribution(hand_size, niter=1e6, seed=0):
+    rng = random.Random(seed)
     sorts = {}
     for i in range(0, int(niter)):
-        hand = random.sample(DECK, hand_size)
+        hand = rng.sample(DECK, hand_size)
         s = get_rank_pattern(hand)
         if s not in sorts.keys():
             sorts[s] = 0
@@ -69,10 +70,11 @@ def get_cluster_pattern(hand):
     return tuple(sorted(cluster_sizes))
 
 @file_cache.cache
-def p_cluster_distribution(hand_size, niter=1e6):
+def p_cluster_distribution(hand_size, niter=1e6, seed=0):
+    rng = random.Random(seed)
     clusters = {}
     for i in range(0, int(niter)):
-        hand = sorted(random.sample(DECK, hand_size))
+        hand = sorted(rng.sample(DECK, hand_size))
         sizes_key = get_cluster_pattern(hand)
         if sizes_key not in clusters.keys():
             clusters[sizes_key] = 0
@@ -82,10 +84,11 @@ def p_cluster_distribution(hand_size, niter=1e6):
     return clusters
 
 @file_cache.cache
-def p_suit_cluster_distribution(hand_size, niter=1e6):
+def p_suit_cluster_distribution(hand_size, niter=1e6, seed=0):
+    rng = random.Random(seed)
     dist = {}
     for i in range(0, int(niter)):
-        hand = sorted(random.sample(DECK, hand_size))
+        hand = sorted(rng.sample(DECK, hand_size))
         suit_key = get_suit_pattern(hand)
         cluster_key = get_cluster_pattern(hand)
         key = (suit_key, cluster_key)
@@ -97,10 +100,11 @@ def p_suit_cluster_distribution(hand_size, niter=1e6):
     return dist
 
 @file_cache.cache
-def p_suit_rank_cluster_distribution(hand_size, niter=1e6):
+def p_suit_rank_cluster_distribution(hand_size, niter=1e6, seed=0):
+    rng = random.Random(seed)
     dist = {}
     for i in range(0, int(niter)):
-        hand = sorted(random.sample(DECK, hand_size))
+        hand = sorted(rng.sample(DECK, hand_size))
         suit_key = get_suit_pattern(hand)
         rank_key = get_rank_pattern(hand)
         cluster_key = get_cluster_pattern(hand)
@@ -113,8 +117,250 @@ def p_suit_rank_cluster_distribution(hand_size, niter=1e6):
     return dist
 
 import math
+import itertools
 import numpy as np
 
+#  Exact pattern distributions
+#
+# The p_*_distribution functions above estimate pattern probabilities
+# by sampling hands.  The functions below count hands exactly instead.
+# For arrays of hands, a card is represented by its index in DECK, so
+# that suit = card // 13 and rank = card % 13 + 1.  A sorted hand (as
+# in the p_*_distribution functions) is then just a sorted array.
+
+def suit_patterns(hand_size):
+    """All possible results of `get_suit_pattern` for `hand_size` cards."""
+    return sorted(set(tuple(sorted(c)) for c in itertools.product(range(0, len(RANKS)+1), repeat=len(SUITS))
+                      if sum(c) == hand_size))
+
+def rank_patterns(hand_size):
+    """All possible results of `get_rank_pattern` for `hand_size` cards."""
+    return sorted(tuple(sorted(c)) for c in _rank_pattern_multiplicities(hand_size))
+
+def cluster_patterns(hand_size):
+    """All possible results of `get_cluster_pattern` for `hand_size`
+    cards, i.e. the partitions of `hand_size`."""
+    return sorted(set(_cluster_pattern_from_breaks(b) for b in itertools.product([0, 1], repeat=hand_size-1)))
+
+def _cluster_pattern_from_breaks(breaks):
+    """The cluster pattern of a hand where consecutive cards are in
+    different clusters wherever `breaks` is 1."""
+    sizes = [1]
+    for b in breaks:
+        if b:
+            sizes.append(1)
+        else:
+            sizes[-1] += 1
+    return tuple(sorted(sizes))
+
+def _rank_pattern_multiplicities(hand_size):
+    """Map each possible rank pattern (as counts per rank, not sorted)
+    to the number of ways of choosing which ranks have which count."""
+    out = {}
+    # m[k-1] is the number of ranks with k cards
+    for m in itertools.product(*[range(0, hand_size//k+1) for k in range(1, len(SUITS)+1)]):
+        if sum((k+1)*mk for k,mk in enumerate(m)) != hand_size or sum(m) > len(RANKS):
+            continue
+        m0 = len(RANKS) - sum(m)
+        pattern = (0,)*m0 + sum([(k+1,)*mk for k,mk in enumerate(m)], ())
+        ways = math.factorial(len(RANKS)) // math.prod(math.factorial(x) for x in (m0,)+m)
+        out[pattern] = ways
+    return out
+
+@functools.lru_cache()
+def _pattern_tables(hand_size):
+    """Lookup tables mapping integer codes of patterns (see
+    `suit_pattern_index` etc.) to their index in `suit_patterns`,
+    `rank_patterns` and `cluster_patterns`."""
+    base = hand_size + 1
+    suits = suit_patterns(hand_size)
+    suit_table = np.full(base**len(SUITS), -1, dtype=np.int32)
+    for i,p in enumerate(suits):
+        suit_table[sum(c*base**j for j,c in enumerate(p))] = i
+    ranks = rank_patterns(hand_size)
+    rank_table = np.full(base**len(SUITS), -1, dtype=np.int32)
+    for i,p in enumerate(ranks):
+        rank_table[sum(p.count(k)*base**(k-1) for k in range(1, len(SUITS)+1))] = i
+    clusters = cluster_patterns(hand_size)
+    cluster_table = np.full(2**max(hand_size-1, 0), -1, dtype=np.int32)
+    for b in itertools.product([0, 1], repeat=hand_size-1):
+        cluster_table[sum(x << j for j,x in enumerate(b))] = clusters.index(_cluster_pattern_from_breaks(b))
+    return suit_table, rank_table, cluster_table
+
+def suit_pattern_index(hands):
+    """For an (n, hand_size) array of hands, find the index of each
+    hand's suit pattern in `suit_patterns(hand_size)`."""
+    hands = np.asarray(hands)
+    base = hands.shape[1] + 1
+    counts = np.sort(np.stack([(hands // len(RANKS) == s).sum(axis=1) for s in SUITS], axis=1), axis=1)
+    return _pattern_tables(hands.shape[1])[0][counts @ base**np.arange(len(SUITS))]
+
+def rank_pattern_index(hands):
+    """For an (n, hand_size) array of hands, find the index of each
+    hand's rank pattern in `rank_patterns(hand_size)`."""
+    hands = np.asarray(hands)
+    base = hands.shape[1] + 1
+    counts = np.stack([(hands % len(RANKS) == r).sum(axis=1) for r in range(0, len(RANKS))], axis=1)
+    code = sum((counts == k).sum(axis=1) * base**(k-1) for k in range(1, len(SUITS)+1))
+    return _pattern_tables(hands.shape[1])[1][code]
+
+def cluster_pattern_index(hands):
+    """For an (n, hand_size) array of hands, in the order they were
+    dealt, find the index of each hand's cluster pattern in
+    `cluster_patterns(hand_size)`."""
+    hands = np.asarray(hands)
+    breaks = np.abs(np.diff((hands % len(RANKS)).astype(int), axis=1)) > 1
+    return _pattern_tables(hands.shape[1])[2][breaks @ (1 << np.arange(hands.shape[1]-1))]
+
+def _iter_hands(hand_size):
+    """Iterate through every possible (sorted) hand of `hand_size`
+    cards, in chunks of up to C(51, hand_size-1) hands, as arrays of
+    card indices."""
+    n = len(DECK)
+    k = hand_size - 1
+    if k == 0: # Each card is a hand by itself
+        yield np.arange(0, n, dtype=np.uint8)[:,None]
+        return
+    # All combinations of the remaining cards, sorted by their largest
+    # element so that the combinations of range(m) are the first
+    # C(m, k) rows.
+    rest = np.fromiter(itertools.chain.from_iterable(itertools.combinations(range(0, n-1), k)),
+                       dtype=np.uint8, count=math.comb(n-1, k)*k).reshape(-1, k)
+    rest = rest[np.argsort(rest[:,-1], kind="stable")]
+    for first in range(0, n-k):
+        tail = rest[0:math.comb(n-first-1, k)] + first + 1
+        yield np.column_stack([np.full(len(tail), first, dtype=np.uint8), tail])
+
+@file_cache.cache
+def exact_suit_distribution(hand_size):
+    """Exact version of `p_suit_distribution`: the number of hands with
+    c_s cards of each suit s is the product of C(13, c_s)."""
+    counts = collections.Counter()
+    for c in itertools.product(range(0, len(RANKS)+1), repeat=len(SUITS)):
+        if sum(c) == hand_size:
+            counts[tuple(sorted(c))] += math.prod(math.comb(len(RANKS), x) for x in c)
+    return {k : v/math.comb(len(DECK), hand_size) for k,v in counts.items()}
+
+@file_cache.cache
+def exact_rank_distribution(hand_size):
+    """Exact version of `p_rank_distribution`.  For each way of
+    splitting `hand_size` into counts per rank, there are C(4, count)
+    ways to choose the suits for each rank."""
+    dist = {}
+    for pattern,ways in _rank_pattern_multiplicities(hand_size).items():
+        n = ways * math.prod(math.comb(len(SUITS), c) for c in pattern)
+        dist[tuple(sorted(pattern))] = n/math.comb(len(DECK), hand_size)
+    return dist
+
+def _cluster_dp(hand_size, suits=False):
+    """Count sorted hands by cluster pattern (and by suit pattern if
+    `suits` is True) with dynamic programming.
+
+    Clusters only depend on consecutive cards in the sorted hand, so we
+    go through the deck in order, deciding whether to take each card,
+    and only remember the rank of the last card taken, the size of the
+    current cluster, and the sizes of finished clusters.
+    """
+    start = ((0,)*len(SUITS) if suits else (), None, 0, ())
+    states = collections.Counter({start : 1})
+    for i,(suit,rank) in enumerate(sorted(DECK)):
+        left = len(DECK) - i - 1
+        new_states = collections.Counter()
+        for (sc, last, cur, done), n in states.items():
+            taken = cur + sum(done)
+            if taken + left >= hand_size: # Skip this card
+                new_states[(sc, last, cur, done)] += n
+            if taken < hand_size: # Take this card
+                if suits:
+                    sc = sc[:suit] + (sc[suit]+1,) + sc[suit+1:]
+                if last is None:
+                    new_states[(sc, rank, 1, done)] += n
+                elif abs(rank-last) <= 1:
+                    new_states[(sc, rank, cur+1, done)] += n
+                else:
+                    new_states[(sc, rank, 1, tuple(sorted(done+(cur,))))] += n
+        states = new_states
+    counts = collections.Counter()
+    for (sc, last, cur, done), n in states.items():
+        cluster_key = tuple(sorted(done+(cur,)))
+        counts[(tuple(sorted(sc)), cluster_key) if suits else cluster_key] += n
+    return {k : v/math.comb(len(DECK), hand_size) for k,v in counts.items()}
+
+@file_cache.cache
+def exact_cluster_distribution(hand_size):
+    """Exact version of `p_cluster_distribution`."""
+    return _cluster_dp(hand_size)
+
+@file_cache.cache
+def exact_suit_cluster_distribution(hand_size):
+    """Exact version of `p_suit_cluster_distribution`."""
+    return _cluster_dp(hand_size, suits=True)
+
+@file_cache.cache
+def exact_suit_rank_cluster_distribution(hand_size, max_hands=2e8, chunk_size=2**21):
+    """Exact version of `p_suit_rank_cluster_distribution`.
+
+    The joint pattern depends on which ranks appear in which suits, so
+    there is no small recursion for it.  Instead, enumerate every hand,
+    `chunk_size` hands at a time (about 2e7 hands for 6 cards, and
+    1.3e8 for 7, which takes a few minutes).  This is the only exact
+    method for the joint distribution, so it raises ValueError if there
+    are more than `max_hands` hands, by default for hands of more than
+    7 cards.  Larger hands can only be estimated with
+    `p_suit_rank_cluster_distribution`.  (The suit, rank and cluster
+    distributions on their own are exact for any hand size.)
+    """
+    total = math.comb(len(DECK), hand_size)
+    if total > max_hands:
+        raise ValueError("Too many hands (%i) to enumerate exactly, use p_suit_rank_cluster_distribution" % total)
+    S, R, C = suit_patterns(hand_size), rank_patterns(hand_size), cluster_patterns(hand_size)
+    counts = np.zeros(len(S)*len(R)*len(C), dtype=np.int64)
+    for chunk in _iter_hands(hand_size):
+        for start in range(0, len(chunk), chunk_size):
+            hands = chunk[start:start+chunk_size]
+            code = (suit_pattern_index(hands)*len(R) + rank_pattern_index(hands))*len(C) + cluster_pattern_index(hands)
+            counts += np.bincount(code, minlength=len(counts))
+    dist = {}
+    for code in np.flatnonzero(counts):
+        si, rest = divmod(int(code), len(R)*len(C))
+        ri, ci = divmod(rest, len(C))
+        dist[(S[si], R[ri], C[ci])] = counts[code]/total
+    return dist
+
+#  Scoring hands
+#
+# The suit, rank and cluster pattern indices of a hand combine into one
+# integer code, (suit*n_ranks + rank)*n_clusters + cluster, which
+# indexes a dense table of probabilities, so scoring a batch of hands
+# is a single gather.
+
+def pattern_code(hands):
+    """For an (n, hand_size) array of hands, in the order they were
+    dealt, find the integer code of each hand's joint (suit, rank,
+    cluster) pattern."""
+    hands = np.asarray(hands)
+    h = hands.shape[1]
+    nr, nc = len(rank_patterns(h)), len(cluster_patterns(h))
+    return (suit_pattern_index(hands)*nr + rank_pattern_index(hands))*nc + cluster_pattern_index(hands)
+
+def pattern_table(dist, hand_size):
+    """Convert `dist`, a joint distribution from
+    `exact_suit_rank_cluster_distribution` or
+    `p_suit_rank_cluster_distribution`, to an array indexed by
+    `pattern_code`.  Patterns missing from `dist` have probability 0."""
+    S, R, C = suit_patterns(hand_size), rank_patterns(hand_size), cluster_patterns(hand_size)
+    S, R, C = ({p : i for i,p in enumerate(x)} for x in (S, R, C))
+    table = np.zeros(len(S)*len(R)*len(C))
+    for (s,r,c),p in dist.items():
+        table[(S[s]*len(R) + R[r])*len(C) + C[c]] = p
+    return table
+
+def score_hands(hands, table):
+    """Probability of the joint pattern of each hand in the (n,
+    hand_size) array `hands`, according to `table` from
+    `pattern_table`."""
+    return table[pattern_code(hands)]
+
 def join_lists(args):
     """Join the lists in `args` together to form one list."""
     l = []
@@ -232,6 +478,145 @@ def overhand_shuffle(deck, mean_nsplits):
     decks.reverse()
     return join_lists(decks)
 
+#  Batched shuffles
+#
+# The shuffles above work on one deck at a time, as a list of (suit,
+# rank) tuples.  The versions below shuffle many decks at once.  Decks
+# are an (n_trials, 52) uint8 array of card indices into DECK (see
+# `deck_to_array`), and each shuffle computes, for every row, the
+# positions to gather the cards from.
+
+def deck_to_array(deck):
+    """Convert a deck (or hand) from a list of (suit, rank) tuples to an
+    array of card indices."""
+    return np.asarray([DECK.index(c) for c in deck], dtype=np.uint8)
+
+def array_to_deck(arr):
+    """Convert an array of card indices back to a list of (suit, rank)
+    tuples."""
+    return [DECK[i] for i in arr]
+
+def deck_batch(deck, ntrials, rng=random):
+    """Stack `ntrials` decks generated by the function `deck` (from the
+    `decks` dictionary) with the random.Random `rng` into an (ntrials,
+    52) array."""
+    return np.stack([deck_to_array(deck(rng)) for _ in range(0, ntrials)])
+
+def _get_rng(rng):
+    return np.random.default_rng() if rng is None else rng
+
+def _take_halves(decks, from_lh, i_half):
+    """Interleave the top `i_half` cards of each deck (taken where
+    `from_lh` is True) with the rest, keeping the order within each
+    half.  `i_half` may be a column with one value per deck."""
+    lh_pos = np.cumsum(from_lh, axis=1) - from_lh
+    rh_pos = np.arange(0, decks.shape[1]) - lh_pos + i_half
+    return np.take_along_axis(decks, np.where(from_lh, lh_pos, rh_pos), axis=1)
+
+def _take_by_label(decks, labels):
+    """Reorder each deck so that cards are grouped by `labels` in
+    increasing order, keeping their order within each group, as when
+    picking up piles."""
+    return np.take_along_axis(decks, np.argsort(labels, axis=1, kind="stable"), axis=1)
+
+def riffle_shuffle_batch(decks, p_switch, rng=None):
+    """Batched version of `riffle_shuffle`."""
+    rng = _get_rng(rng)
+    n, L = decks.shape
+    sw = rng.random((n, L-1)) < p_switch
+    start = rng.integers(0, 2, (n, 1))
+    split = (np.cumsum(np.concatenate([start, sw], axis=1), axis=1) % 2).astype(bool)
+    return riffle_interleave_batch(decks, split)
+
+def riffle_interleave_batch(decks, split):
+    """The deterministic part of `riffle_shuffle_batch`: interleave the
+    two halves of each deck, taking the next card from the top half
+    where the boolean array `split` is True.  Once one half runs out,
+    the rest of the cards come from the other half, whatever `split`
+    says."""
+    n, L = decks.shape
+    i_half = L//2
+    ones_before = np.cumsum(split, axis=1) - split
+    zeros_before = np.arange(0, L) - ones_before
+    lh_empty = ones_before >= i_half
+    empty = lh_empty | (zeros_before >= L - i_half)
+    first_empty = np.argmax(empty, axis=1)[:,None]
+    after = np.arange(0, L) >= first_empty
+    lh_empty_first = np.take_along_axis(lh_empty, first_empty, axis=1)
+    from_lh = np.where(after, ~lh_empty_first, split)
+    return _take_halves(decks, from_lh, i_half)
+
+def riffle_gsr_shuffle_batch(decks, rng=None):
+    """Batched version of `riffle_gsr_shuffle`.  Dropping cards with
+    probability proportional to the size of each half gives every
+    interleaving of the two halves equal probability, so choose the
+    positions of the top half uniformly at random."""
+    rng = _get_rng(rng)
+    n, L = decks.shape
+    split_pos = rng.binomial(L, .5, (n, 1))
+    from_lh = np.argsort(rng.random((n, L)), axis=1) < split_pos
+    return gsr_interleave_batch(decks, from_lh)
+
+def gsr_interleave_batch(decks, from_lh):
+    """The deterministic part of `riffle_gsr_shuffle_batch`: cut each
+    deck after as many cards as `from_lh` has True values, and
+    interleave the halves, taking from the top half where `from_lh` is
+    True."""
+    return _take_halves(decks, from_lh, np.sum(from_lh, axis=1, keepdims=True))
+
+def overhand_shuffle_batch(decks, mean_nsplits, rng=None):
+    """Batched version of `overhand_shuffle`."""
+    rng = _get_rng(rng)
+    n, L = decks.shape
+    nsplits = np.minimum(rng.binomial(L, mean_nsplits/L, (n, 1)), L-2)
+    # Choose `nsplits` of the split points 1..L-2 at random
+    ranks = np.argsort(np.argsort(rng.random((n, L-2)), axis=1), axis=1)
+    starts = np.zeros((n, L), dtype=bool)
+    starts[:,1:L-1] = ranks < nsplits
+    return overhand_cut_batch(decks, starts)
+
+def overhand_cut_batch(decks, starts):
+    """The deterministic part of `overhand_shuffle_batch`: split each
+    deck into packets starting where the boolean array `starts` is
+    True, and reverse the order of the packets."""
+    return _take_by_label(decks, -np.cumsum(starts, axis=1))
+
+def pile_shuffle_batch(decks, npiles, rng=None):
+    """Batched version of `pile_shuffle`."""
+    return decks[:,np.argsort(np.arange(0, decks.shape[1]) % npiles, kind="stable")]
+
+def pile_shuffle_random_pickup_batch(decks, npiles, rng=None):
+    """Batched version of `pile_shuffle_random_pickup`."""
+    rng = _get_rng(rng)
+    n, L = decks.shape
+    order = np.argsort(rng.random((n, npiles)), axis=1)
+    return _take_by_label(decks, order[:,np.arange(0, L) % npiles])
+
+def pile_shuffle_random_distribute_batch(decks, npiles, rng=None):
+    """Batched version of `pile_shuffle_random_distribute`."""
+    rng = _get_rng(rng)
+    n, L = decks.shape
+    nrounds = math.ceil(L/npiles)
+    piles = np.argsort(rng.random((n, nrounds, npiles)), axis=2).reshape(n, -1)[:,0:L]
+    return _take_by_label(decks, piles)
+
+def pile_shuffle_fully_random_distribute_batch(decks, npiles, rng=None):
+    """Batched version of `pile_shuffle_fully_random_distribute`."""
+    rng = _get_rng(rng)
+    return _take_by_label(decks, rng.integers(0, npiles, decks.shape))
+
+def iterate_shuffle_batch(decks, method, niter, rng=None):
+    """Perform the batched shuffle `method` on `decks` `niter` times."""
+    rng = _get_rng(rng)
+    for _ in range(0, niter):
+        decks = method(decks, rng=rng)
+    return decks
+
+pile_methods_batch = {"none": pile_shuffle_batch,
+                      "pickup": pile_shuffle_random_pickup_batch,
+                      "distribute": pile_shuffle_random_distribute_batch,
+                      "fully": pile_shuffle_fully_random_distribute_batch}
+
 # Default shuffling methods
 from collections import OrderedDict
 
@@ -271,70 +656,97 @@ methods['pile_6_rd'] = lambda x : pile_shuffle_random_distribute(x, 6)
 methods['pile_7_rd'] = lambda x : pile_shuffle_random_distribute(x, 7)
 methods['pile_8_rd'] = lambda x : pile_shuffle_random_distribute(x, 8)
 
+# Batched versions of the default shuffling methods
+methods_batch = OrderedDict()
+methods_batch['riffle_me'] = lambda x, rng=None : riffle_shuffle_batch(x, .45, rng)
+methods_batch['riffle_expert'] = lambda x, rng=None : riffle_shuffle_batch(x, .8, rng)
+methods_batch['riffle_bad'] = lambda x, rng=None : riffle_shuffle_batch(x, .2, rng)
+methods_batch['riffle_gsr'] = lambda x, rng=None : riffle_gsr_shuffle_batch(x, rng)
+methods_batch['overhand'] = lambda x, rng=None : overhand_shuffle_batch(x, 5, rng)
+methods_batch['overhand_many'] = lambda x, rng=None : overhand_shuffle_batch(x, 8, rng)
+methods_batch['overhand_few'] = lambda x, rng=None : overhand_shuffle_batch(x, 3, rng)
+for _n in range(1, 9):
+    methods_batch['pile_%i' % _n] = functools.partial(pile_shuffle_batch, npiles=_n)
+    methods_batch['pile_%i_rp' % _n] = functools.partial(pile_shuffle_random_pickup_batch, npiles=_n)
+    methods_batch['pile_%i_rd' % _n] = functools.partial(pile_shuffle_random_distribute_batch, npiles=_n)
+
 SUITS = list(range(0, 4))
 RANKS = list(range(1, 14))
 RED_SUITS = [1, 3]
 BLACK_SUITS = [0, 2]
 DECK = [(suit, rank) for suit in SUITS for rank in RANKS]
 
+# Each deck generator takes a random.Random (or the random module) to
+# draw from.
 decks = OrderedDict()
-decks['Shuffled deck'] = lambda : random.sample(DECK, 52)
-decks['Sorted deck (by suit)'] = lambda : DECK
-decks['Sorted deck (by rank)'] = lambda : [(suit, rank) for rank in RANKS for suit in SUITS]
+decks['Shuffled deck'] = lambda rng=random : rng.sample(DECK, 52)
+decks['Sorted deck (by suit)'] = lambda rng=random : DECK
+decks['Sorted deck (by rank)'] = lambda rng=random : [(suit, rank) for rank in RANKS for suit in SUITS]
 
 # Defining deck patterns which originate from different games
 
 # Groups of 4 in  a row by suit
-def go_fish_4():
-    return join_lists([[(suit, rank) for suit in random.sample(SUITS, 4)]
-                                     for rank in random.sample(RANKS, 13)])
+def go_fish_4(rng=random):
+    return join_lists([[(suit, rank) for suit in rng.sample(SUITS, 4)]
+                                     for rank in rng.sample(RANKS, 13)])
 assert sorted(DECK) == sorted(go_fish_4())
 decks['Go Fish (four-card)'] = go_fish_4
 
 # Groups of 2 in a row by suit
-def go_fish_2():
+def go_fish_2(rng=random):
     d = []
-    gf4 = go_fish_4()
+    gf4 = go_fish_4(rng)
     for i in range(0, 52, 2):
         d.append(gf4[i:i+2])
-    random.shuffle(d)
+    rng.shuffle(d)
     return join_lists(d)
     
 assert sorted(DECK) == sorted(go_fish_2())
 decks['Go Fish (two-card)'] = go_fish_2
 
 # Where only the color must be correct
-def go_fish_color():
+def go_fish_color(rng=random):
     red = [[(suit, rank) for suit in RED_SUITS] for rank in RANKS]
     black = [[(suit, rank) for suit in BLACK_SUITS] for rank in RANKS]
     d = red + black
-    random.shuffle(d)
+    rng.shuffle(d)
     return join_lists(d)
 
 assert sorted(DECK) == sorted(go_fish_color())
 decks['Go Fish (color variant)'] = go_fish_color
 
-def kings_corners():
+def kings_corners(rng=random):
     l = [[] for _ in range(0, len(SUITS))]
     for i,rank in enumerate(RANKS):
         if i % 2 == 0:
-            s = random.sample(RED_SUITS, 2) + random.sample(BLACK_SUITS, 2)
+            s = rng.sample(RED_SUITS, 2) + rng.sample(BLACK_SUITS, 2)
         else:
-            s = random.sample(BLACK_SUITS, 2) + random.sample(RED_SUITS, 2)
+            s = rng.sample(BLACK_SUITS, 2) + rng.sample(RED_SUITS, 2)
         for i in range(0, len(SUITS)):
             l[i].append((s[i], rank))
-    random.shuffle(l)
+    rng.shuffle(l)
     return join_lists(l)
 
 assert sorted(DECK) == sorted(kings_corners())
 decks['Kings Corners'] = kings_corners
 
-def durak():
+def _poisson(rng, lam):
+    """A Poisson random number with mean `lam`, from random.Random
+    `rng`: the number of events in unit time when the times between
+    them are exponential."""
+    n = 0
+    t = rng.expovariate(lam)
+    while t < 1:
+        n += 1
+        t += rng.expovariate(lam)
+    return n
+
+def durak(rng=random):
     remaining_ranks = RANKS.copy()
-    random.shuffle(remaining_ranks)
+    rng.shuffle(remaining_ranks)
     subdeck_ranks = []
     while remaining_ranks:
-        pilesize = np.random.poisson(1)
+        pilesize = _poisson(rng, 1)
         if pilesize > len(remaining_ranks):
             pilesize = len(remaining_ranks)
         if pilesize == 0:
@@ -344,7 +756,7 @@ def durak():
     cards = []
     for rnks in subdeck_ranks:
         thispile = [(st, rnk) for rnk in rnks for st in SUITS]
-        random.shuffle(thispile)
+        rng.shuffle(thispile)
         cards += thispile
     return cards
 
@@ -357,3 +769,96 @@ def deal_naive(deck, players=4, handsize=6):
 
 def deal_basic(deck, players=4, handsize=6):
     return deck[0:handsize*players:players]
+
+# Batched versions of the deals, for arrays of decks
+def deal_naive_batch(decks, players=4, handsize=6):
+    return decks[:,0:handsize]
+
+def deal_basic_batch(decks, players=4, handsize=6):
+    return decks[:,0:handsize*players:players]
+
+#  Monte Carlo estimates
+#
+# When there is no exact count, e.g. for a different deal, estimate a
+# pattern distribution by sampling in chunks, possibly across several
+# processes, until the estimate is precise enough.
+
+import os
+import concurrent.futures
+
+# Patterns which can be estimated by name, as the function giving each
+# hand's pattern index and the function listing all patterns.
+PATTERNS = {"suit": (suit_pattern_index, suit_patterns),
+            "rank": (rank_pattern_index, rank_patterns),
+            "cluster": (cluster_pattern_index, cluster_patterns),
+            "suit_rank_cluster": (pattern_code, lambda h : list(itertools.product(suit_patterns(h), rank_patterns(h), cluster_patterns(h))))}
+
+def _count_patterns(task):
+    """Deal `n` hands from uniformly shuffled decks and count their
+    patterns."""
+    seed, n, hand_size, deal, pattern, sort = task
+    rng = np.random.default_rng(seed)
+    decks = np.argsort(rng.random((n, len(DECK))), axis=1).astype(np.uint8)
+    hands = deal(decks, handsize=hand_size)
+    if sort:
+        hands = np.sort(hands, axis=1)
+    codes, counts = np.unique(pattern(hands), return_counts=True)
+    return collections.Counter(dict(zip(codes.tolist(), counts.tolist())))
+
+def _relative_error(counts, n, min_p):
+    """Largest relative standard error of the estimated probability of
+    any pattern with an estimated probability of at least `min_p`."""
+    c = np.asarray(list(counts.values()), dtype=float)
+    c = c[c/n >= min_p]
+    return np.max(np.sqrt((1-c/n)/c)) if len(c) > 0 else np.inf
+
+def estimate_distribution(hand_size, pattern="suit_rank_cluster", deal=None, sort=True,
+                          rtol=.01, min_p=1e-3, max_samples=1e7, chunk_size=1e5, seed=0, workers=1):
+    """Estimate the distribution of a hand pattern by sampling.
+
+    `pattern` is a key of PATTERNS, or a function taking an (n,
+    hand_size) array of hands and returning an integer code for each.
+    Hands are dealt with the batched deal function `deal` (by default
+    `deal_naive_batch`) and, if `sort` is True, sorted as in the
+    p_*_distribution functions.
+
+    Samples are drawn in chunks of `chunk_size`, each with its own
+    numpy Generator spawned from `seed`, and spread across `workers`
+    processes (None means one per CPU).  Sampling stops once the
+    relative standard error of every pattern with probability at least
+    `min_p` is below `rtol`, or after `max_samples` samples.  Chunks
+    are checked in order, so the result only depends on `seed` and not
+    on the number of workers.
+
+    Returns a dict mapping patterns (or codes, for a custom `pattern`)
+    to probabilities, like p_*_distribution.
+    """
+    deal = deal_naive_batch if deal is None else deal
+    pattern_func, all_patterns = PATTERNS[pattern] if isinstance(pattern, str) else (pattern, None)
+    chunk_size = int(chunk_size)
+    n_chunks = math.ceil(max_samples/chunk_size)
+    n_workers = os.cpu_count() if workers is None else workers
+    seeds = np.random.SeedSequence(seed)
+    counts = collections.Counter()
+    chunks = 0
+    done = False
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) if n_workers > 1 else None
+    try:
+        while not done and chunks < n_chunks:
+            # One round, with a chunk for each worker
+            tasks = [(s, chunk_size, hand_size, deal, pattern_func, sort)
+                     for s in seeds.spawn(min(n_workers, n_chunks - chunks))]
+            for r in (map if pool is None else pool.map)(_count_patterns, tasks):
+                counts.update(r)
+                chunks += 1
+                if _relative_error(counts, chunks*chunk_size, min_p) <= rtol:
+                    done = True
+                    break
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    n = chunks*chunk_size
+    if all_patterns is not None:
+        all_patterns = all_patterns(hand_size)
+        return {all_patterns[k] : v/n for k,v in counts.items()}
+    return {k : v/n for k,v in counts.items()}
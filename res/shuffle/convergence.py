@@ -0,0 +1,138 @@
+# Copyright 2017 Max Shinn
+# Available under the GPLv3
+# http://blog.maxshinnpotential.com/2017/11/05/how-you-should-be-shuffling-cards.html
+
+# Exact convergence of the shuffles in cards.py to a uniformly random
+# deck, measured by the total variation distance between the
+# distribution of decks after k shuffles and the uniform distribution.
+#
+# For the GSR riffle shuffle, k shuffles are the same as one "2^k
+# shuffle", under which a permutation with r rising sequences has
+# probability C(2^k + n - r, n) / 2^(kn) (Bayer and Diaconis, 1992).
+# Since the number of permutations with r rising sequences is an
+# Eulerian number, this is exact and fast even for 52 cards.
+#
+# The other shuffles have no such formula, so we find the exact
+# distribution of a single shuffle by enumerating all of its random
+# choices, and then run the Markov chain over all n! orderings of a
+# small deck with a sparse transition matrix.
+
+import math
+import itertools
+from fractions import Fraction
+import numpy as np
+import scipy.sparse
+import scipy.stats
+from cards import file_cache, riffle_interleave_batch, gsr_interleave_batch, overhand_cut_batch
+
+# Largest deck for which to build the n!-state Markov chain.  The
+# transition matrix has one entry per state and possible shuffle, at
+# about 36 bytes each while it is built, e.g. 0.1-0.4GB for 8 cards but
+# 1.6-6.6GB for 9.  Chains bigger than MAX_MARKOV_BYTES are refused.
+MAX_MARKOV_CARDS = 8
+MAX_MARKOV_BYTES = 1e9
+
+def eulerian_numbers(n):
+    """The number of permutations of `n` cards with r rising sequences,
+    for r = 1..n, as a list of exact integers."""
+    row = [1]
+    for m in range(2, n+1):
+        row = [(k+1)*(row[k] if k < len(row) else 0) + (m-k)*(row[k-1] if k > 0 else 0)
+               for k in range(0, m)]
+    return row
+
+@file_cache.cache
+def tv_gsr(n_cards=52, max_shuffles=20):
+    """Exact total variation distance to uniform after 0, 1, ...,
+    `max_shuffles` GSR riffle shuffles of `n_cards` cards."""
+    A = eulerian_numbers(n_cards)
+    nfact = math.factorial(n_cards)
+    tv = [1 - Fraction(1, nfact)] # No shuffles: the deck is sorted
+    for k in range(1, max_shuffles+1):
+        a = 2**k
+        an = a**n_cards
+        # Work in integers scaled by a^n n! to keep this exact
+        tot = sum(A[r-1] * abs(math.comb(a+n_cards-r, n_cards)*nfact - an)
+                  for r in range(1, n_cards+1))
+        tv.append(Fraction(tot, 2*an*nfact))
+    return np.asarray([float(x) for x in tv])
+
+def shuffle_distribution(method, n_cards, **kwargs):
+    """The exact distribution of one shuffle of `n_cards` cards, as an
+    array of permutations (one per row, in the format of the batched
+    shuffles in cards.py) and an array of their probabilities.
+
+    `method` is "riffle" (with `p_switch`), "riffle_gsr", or
+    "overhand" (with `mean_nsplits`).  As in `overhand_shuffle_batch`,
+    the number of overhand splits is capped at `n_cards`-2.
+    """
+    identity = np.arange(0, n_cards, dtype=np.uint8)
+    if method in ["riffle", "riffle_gsr"]:
+        # Which half each card comes from.  For "riffle", the first is a
+        # coin flip, and each of the rest switches with p_switch.  For
+        # GSR, each card is equally likely to come from either half.
+        split = np.asarray(list(itertools.product([False, True], repeat=n_cards)), dtype=bool)
+        decks = np.tile(identity, (len(split), 1))
+        if method == "riffle":
+            n_switches = np.sum(split[:,1:] != split[:,:-1], axis=1)
+            p = kwargs["p_switch"]
+            probs = .5 * p**n_switches * (1-p)**(n_cards-1-n_switches)
+            perms = riffle_interleave_batch(decks, split)
+        else:
+            probs = np.full(len(split), .5**n_cards)
+            perms = gsr_interleave_batch(decks, split)
+    elif method == "overhand":
+        n_points = n_cards - 2
+        p_nsplits = scipy.stats.binom.pmf(np.arange(0, n_cards+1), n_cards, kwargs["mean_nsplits"]/n_cards)
+        p_nsplits[n_points] += np.sum(p_nsplits[n_points+1:])
+        starts = np.zeros((2**n_points, n_cards), dtype=bool)
+        starts[:,1:n_cards-1] = list(itertools.product([False, True], repeat=n_points))
+        k = np.sum(starts, axis=1)
+        probs = p_nsplits[k] / np.asarray([math.comb(n_points, i) for i in k])
+        perms = overhand_cut_batch(np.tile(identity, (len(starts), 1)), starts)
+    else:
+        raise ValueError("Invalid shuffle method")
+    # Different random choices can give the same permutation
+    perms, inverse = np.unique(perms, axis=0, return_inverse=True)
+    return perms, np.bincount(inverse.ravel(), weights=probs)
+
+def _perm_codes(perms):
+    """Integer code of each permutation (row), increasing in
+    lexicographic order."""
+    n = perms.shape[1]
+    return perms.astype(np.int64) @ (n**np.arange(n-1, -1, -1, dtype=np.int64))
+
+@file_cache.cache
+def tv_markov(method, n_cards, max_shuffles=20, **kwargs):
+    """Exact total variation distance to uniform after 0, 1, ...,
+    `max_shuffles` shuffles of `n_cards` cards, for any `method`
+    accepted by `shuffle_distribution`.  The deck starts sorted.
+
+    The Markov chain has n! states, so this is capped at 8 cards
+    (MAX_MARKOV_CARDS), and at chains needing more than 1GB
+    (MAX_MARKOV_BYTES).  Use `tv_gsr` for full decks.
+    """
+    if n_cards > MAX_MARKOV_CARDS:
+        raise ValueError("Too many cards for the exact Markov chain, use at most %i" % MAX_MARKOV_CARDS)
+    shuffles, probs = shuffle_distribution(method, n_cards, **kwargs)
+    n_bytes = 36 * len(shuffles) * math.factorial(n_cards)
+    if n_bytes > MAX_MARKOV_BYTES:
+        raise ValueError("The exact Markov chain would need about %.1fGB, more than MAX_MARKOV_BYTES" % (n_bytes/1e9))
+    states = np.asarray(list(itertools.permutations(range(0, n_cards))), dtype=np.uint8)
+    codes = _perm_codes(states)
+    # Transition from each deck to the deck after each possible shuffle,
+    # i.e. the deck gathered at the shuffle's positions.
+    rows, cols, vals = [], [], []
+    for shuffle,p in zip(shuffles, probs):
+        rows.append(np.searchsorted(codes, _perm_codes(states[:,shuffle])))
+        cols.append(np.arange(0, len(states)))
+        vals.append(np.full(len(states), p))
+    T = scipy.sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                                shape=(len(states), len(states)))
+    dist = np.zeros(len(states))
+    dist[0] = 1 # Sorted deck
+    tv = []
+    for k in range(0, max_shuffles+1):
+        tv.append(.5*np.sum(np.abs(dist - 1/len(states))))
+        dist = T @ dist
+    return np.asarray(tv)
@@ -0,0 +1,225 @@
+# Copyright 2017 Max Shinn
+# Available under the GPLv3
+# http://blog.maxshinnpotential.com/2017/11/05/how-you-should-be-shuffling-cards.html
+
+# A small on-disk cache for the results of slow functions.
+#
+# Results are keyed on a hash of the function's source code, the
+# source of the functions and the values of the module-level variables
+# (such as DECK) it uses, and its arguments.  Changing any of these
+# gives a new entry, rather than silently returning a stale result.
+# Random functions should take their seed as an argument so that it is
+# part of the key.
+#
+# Each entry is a .npy file, loaded with memory mapping, and a small
+# JSON file describing how to turn it back into the result.  Results
+# can be numpy arrays or dicts mapping (possibly nested) tuples of ints
+# to numbers, like the pattern distributions in cards.py.  When the
+# cache grows beyond `max_bytes`, the least recently used entries are
+# deleted.
+
+import os
+import json
+import hashlib
+import inspect
+import functools
+import types
+import numpy as np
+
+class FileCache:
+    def __init__(self, directory="cache", max_bytes=256e6):
+        self.directory = directory
+        self.max_bytes = max_bytes
+    def cache(self, func):
+        """Decorator to cache the results of `func` on disk."""
+        signature = inspect.signature(func)
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = "%s-%s" % (func.__name__, function_hash(func, dict(bound.arguments)))
+            result = self.load(key)
+            if result is None:
+                result = func(*args, **kwargs)
+                self.save(key, result)
+            return result
+        return wrapper
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".npy", base + ".json"
+    def load(self, key):
+        """Load the entry `key`, or return None if it does not exist."""
+        npy, meta = self._paths(key)
+        try:
+            with open(meta, "r") as f:
+                layout = json.load(f)
+            data = np.load(npy, mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return None
+        # Mark as recently used
+        os.utime(npy)
+        os.utime(meta)
+        return decode(data, layout)
+    def save(self, key, result):
+        """Save `result` as the entry `key`, and evict old entries if
+        the cache is too big."""
+        os.makedirs(self.directory, exist_ok=True)
+        data, layout = encode(result)
+        npy, meta = self._paths(key)
+        np.save(npy, data)
+        with open(meta, "w") as f:
+            json.dump(layout, f)
+        self.evict()
+    def evict(self):
+        """Delete the least recently used entries until the cache is no
+        bigger than `self.max_bytes`."""
+        entries = []
+        for fn in os.listdir(self.directory):
+            if fn.endswith(".npy"):
+                npy, meta = self._paths(fn[:-4])
+                if os.path.exists(meta):
+                    entries.append((os.path.getmtime(npy), os.path.getsize(npy) + os.path.getsize(meta), npy, meta))
+        total = sum(e[1] for e in entries)
+        for _,size,npy,meta in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(npy)
+            os.remove(meta)
+            total -= size
+    def clear(self):
+        """Delete every entry."""
+        if os.path.isdir(self.directory):
+            for fn in os.listdir(self.directory):
+                if fn.endswith(".npy") or fn.endswith(".json"):
+                    os.remove(os.path.join(self.directory, fn))
+
+def function_hash(func, arguments):
+    """Hash the source of `func`, its dependencies (see
+    `_dependencies`), and `arguments`."""
+    found = _dependencies(func)
+    directory = _directory(func)
+    args = _describe(arguments, found, directory, strict=False)
+    h = hashlib.sha1()
+    for name,src in sorted(found.items()):
+        h.update(("%s\n%s\n" % (name, src)).encode())
+    h.update(args.encode())
+    return h.hexdigest()
+
+def _directory(func):
+    """The directory of the file defining `func`, or None if it wasn't
+    defined in a file (e.g. interactively)."""
+    try:
+        path = inspect.getsourcefile(func)
+    except TypeError:
+        return None
+    return os.path.dirname(os.path.abspath(path)) if path else None
+
+def _source(func):
+    """The source code of `func`.  Functions defined interactively (or
+    with exec) have no source, so use a hash of their bytecode and
+    constants instead."""
+    try:
+        return inspect.getsource(func)
+    except (OSError, TypeError):
+        code = func.__code__
+        consts = [c for c in code.co_consts if not isinstance(c, types.CodeType)]
+        return "%s:%s" % (func.__qualname__, hashlib.sha1(code.co_code + repr(consts).encode()).hexdigest())
+
+def _dependencies(func, found=None):
+    """Map the names of `func` and everything it depends on to their
+    source code (for functions) or value (for data).  Dependencies are
+    the global variables it uses, and, recursively, the functions it
+    uses which are defined in the same directory.  Library functions
+    and modules are not followed."""
+    found = {} if found is None else found
+    func = inspect.unwrap(func)
+    found[_function_name(func)] = _source(func)
+    directory = _directory(func)
+    for name in _global_names(func.__code__):
+        if name in func.__globals__:
+            desc = _describe(func.__globals__[name], found, directory)
+            if desc is not None:
+                found.setdefault(name, desc)
+    return found
+
+def _function_name(func):
+    """A name for `func`.  Lambdas all have the same name, so use their
+    source too."""
+    name = func.__module__ + "." + func.__qualname__
+    if func.__name__ == "<lambda>":
+        name += ":" + _source(func).strip()
+    return name
+
+def _describe(obj, found, directory, strict=True):
+    """Describe `obj` as a string which, unlike its repr, does not
+    depend on memory addresses, adding the dependencies of any
+    functions from `directory` it contains to `found`.  Returns None
+    for things which are not followed, like modules, or if `strict` is
+    False, uses the repr of things it doesn't know about."""
+    d = lambda x : _describe(x, found, directory, strict)
+    if isinstance(obj, functools.partial):
+        return "partial(%s, %s, %s)" % tuple(d(x) for x in (obj.func, obj.args, obj.keywords))
+    if callable(obj):
+        obj = inspect.unwrap(obj) # e.g. cached functions
+    if isinstance(obj, types.FunctionType):
+        name = _function_name(obj)
+        if name not in found and directory is not None and _directory(obj) == directory:
+            _dependencies(obj, found)
+        return name
+    if isinstance(obj, np.ndarray):
+        return hashlib.sha1(obj.tobytes()).hexdigest()
+    if isinstance(obj, dict):
+        items = sorted("%s: %s" % (d(k), d(v)) for k,v in obj.items())
+        return "{" + ", ".join(items) + "}"
+    if isinstance(obj, (list, tuple, range)):
+        return "[" + ", ".join(str(d(x)) for x in obj) + "]"
+    if isinstance(obj, (set, frozenset)):
+        return "{" + ", ".join(sorted(str(d(x)) for x in obj)) + "}"
+    if isinstance(obj, (int, float, complex, str, bytes, type(None))):
+        return repr(obj)
+    return None if strict or isinstance(obj, (types.ModuleType, type)) else repr(obj)
+
+def _global_names(code):
+    """All names used by `code` and any code nested inside it (e.g.
+    comprehensions and lambdas)."""
+    names = set(code.co_names)
+    for c in code.co_consts:
+        if isinstance(c, types.CodeType):
+            names |= _global_names(c)
+    return names
+
+def encode(result):
+    """Convert `result` to an array and a description of how to convert
+    it back."""
+    if isinstance(result, np.ndarray):
+        return result, {"type": "array"}
+    if isinstance(result, dict):
+        # Each key is flattened into one row of ints, with each tuple
+        # padded with -1 to the longest tuple in its position.
+        keys = list(result.keys())
+        nested = len(keys) > 0 and isinstance(keys[0][0], tuple)
+        parts = [list(k) if nested else [k] for k in keys]
+        widths = [max(len(p[i]) for p in parts) for i in range(0, len(parts[0]))] if parts else []
+        data = np.full((len(keys), sum(widths)+1), -1, dtype=float)
+        for row,(p,k) in enumerate(zip(parts, keys)):
+            offset = 0
+            for part,w in zip(p, widths):
+                data[row,offset:offset+len(part)] = part
+                offset += w
+            data[row,-1] = result[k]
+        return data, {"type": "dict", "nested": nested, "widths": widths}
+    raise TypeError("Cannot cache results of type %s" % type(result).__name__)
+
+def decode(data, layout):
+    """Inverse of `encode`."""
+    if layout["type"] == "array":
+        return data
+    out = {}
+    for row in data:
+        parts = []
+        offset = 0
+        for w in layout["widths"]:
+            parts.append(tuple(int(x) for x in row[offset:offset+w] if x >= 0))
+            offset += w
+        out[tuple(parts) if layout["nested"] else parts[0]] = float(row[-1])
+    return out
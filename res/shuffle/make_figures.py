@@ -3,7 +3,7 @@
 # http://blog.maxshinnpotential.com/2017/11/05/how-you-should-be-shuffling-cards.html
 
 from cards import *
-from collections import defaultdict
+from trials import shuffle_trials, pile_trials, composite_trials, select
 import matplotlib.pyplot as plt
 import seaborn as sns
 from statistics import median
@@ -14,21 +14,19 @@ sns.set_palette(sns.color_palette("hls", len(decks)))
 
 HANDSIZE = 6
 
-# Simulate the joint distributions of expected suit, rank, and
-# clustering.
-#suit_dist = p_suit_distribution(HANDSIZE, 1e7)
-#rank_dist = p_rank_distribution(HANDSIZE, 1e7)
-#cluster_dist = p_cluster_distribution(HANDSIZE, 1e7)
-#suit_cluster_dist = p_suit_cluster_distribution(HANDSIZE, 1e7)
-suit_rank_cluster_dist = defaultdict(lambda : 0, p_suit_rank_cluster_distribution(HANDSIZE, 1e7))
+# Hands are scored with the exact joint distributions of expected suit,
+# rank, and clustering (see trials.py).  The marginals are:
+#suit_dist = exact_suit_distribution(HANDSIZE)
+#rank_dist = exact_rank_distribution(HANDSIZE)
+#cluster_dist = exact_cluster_distribution(HANDSIZE)
+#suit_cluster_dist = exact_suit_cluster_distribution(HANDSIZE)
 
-def test(deck, deal=deal_basic, players=4):
-    """Deal a hand from deck `deck` using dealing function `deal` to
-    `players` players and find the joint probability of the hand."""
-    suit_pattern = get_suit_pattern(deal(deck, handsize=HANDSIZE, players=players))
-    rank_pattern = get_rank_pattern(deal(deck, handsize=HANDSIZE, players=players))
-    cluster_pattern = get_cluster_pattern(deal(deck, handsize=HANDSIZE, players=players))
-    return suit_rank_cluster_dist[(suit_pattern, rank_pattern, cluster_pattern)]
+def plot_trials(results):
+    """Plot the score of each deck against the step in `results`, a
+    table from trials.py."""
+    for name in decks.keys():
+        r = select(results, deck=name)
+        plt.plot(r["x"], r["score"], label=name)
 
 
 #  ___ _  __  __ _          _         __  __ _
@@ -47,20 +45,9 @@ def plot_shuffles(method, n_shuffles=10, ntrials=100):
     `n_shuffles` is the maximum number of shuffle iterations, i.e. 3
     riffle shuffles, 4 riffle shuffles, etc.
 
-    `ntrials` is the number of times to compute this quantity before
-    taking the median.
+    `ntrials` is the number of decks to sum the log likelihood over.
     """
-    method = methods[method]
-    for name,deck in decks.items():
-        print("Testing %s" % name)
-        shuffle_ns = list(range(0, n_shuffles))
-        prob = []
-        for n in shuffle_ns:
-            thisprob = []
-            for _ in range(0, ntrials):
-                thisprob.append(math.log10(1e-10+test(iterate_shuffle(deck(), method, n), deal=deal_naive)))
-            prob.append(sum(thisprob))
-        plt.plot(shuffle_ns, prob, label=name)
+    plot_trials(shuffle_trials([method], n_shuffles, ntrials, handsize=HANDSIZE))
 
 plt.figure(figsize=(8,6))
 plt.subplot(2,2,1)
@@ -134,7 +121,7 @@ plt.show(block=False)
 
 
 
-def plot_pile_shuffles(randomize="none", ntrials=100, deal=deal_naive, players=4):
+def plot_pile_shuffles(randomize="none", ntrials=100, deal=deal_naive_batch, players=4):
     """Plot pile shuffle accuracy for various numbers of piles.
 
     `ranzomize` can either be "none", "distribute", "fully", or
@@ -143,34 +130,14 @@ def plot_pile_shuffles(randomize="none", ntrials=100, deal=deal_naive, players=4
     third card in pile 2, fourth card in pile 1) or else how they are
     picked up.
     
-    `ntrials` is the number of times to compute this quantity before
-    taking the median.
+    `ntrials` is the number of decks to sum the log likelihood over.
 
     `players` is the number of players to deal for.  Only applies to
-    `deal_basic`.
+    `deal_basic_batch`.
 
-    `deal` is either `deal_naive` or `deal_basic`.
+    `deal` is either `deal_naive_batch` or `deal_basic_batch`.
     """
-    for name,deck in decks.items():
-        print("Testing %s" % name)
-        pile_ns = list(range(1, 15))
-        prob = []
-        for n in pile_ns:
-            if randomize == "none":
-                method = lambda x : pile_shuffle(x, n)
-            elif randomize == "pickup":
-                method = lambda x : pile_shuffle_random_pickup(x, n)
-            elif randomize == "distribute":
-                method = lambda x : pile_shuffle_random_distribute(x, n)
-            elif randomize == "fully":
-                method = lambda x : pile_shuffle_fully_random_distribute(x, n)
-            else:
-                raise ValueError("Invalid pile randomization type")
-            thisprob = []
-            for _ in range(0, ntrials):
-                thisprob.append(math.log10(1e-10+test(method(deck()), deal=deal, players=players)))
-            prob.append(sum(thisprob))
-        plt.plot(pile_ns, prob, label=name)
+    plot_trials(pile_trials([randomize], range(1, 15), ntrials, deal=deal, players=players, handsize=HANDSIZE))
     plt.axis([1, 14, None, None])
 
 plt.figure(figsize=(8,6))
@@ -207,36 +174,14 @@ plt.show(block=False)
 #  \___\___/_|_|_|_.__/_|_||_\__,_|\__|_\___/_||_/__/
 
 
-def compose_methods(shuffle_types, shuffle_functions):
-    """Combine multiple shuffle functions into one.
-
-    `Shuffle_types` should be a list of ints, indexing
-    `shuffle_functions`.  `shuffle_functions` is a list of functions
-    which take one argument, the deck, and return a shuffled deck.
-    """
-    def shuffle_composite_function(deck):
-        deck = deck.copy()
-        for t in shuffle_types:
-            deck = shuffle_functions[t](deck)
-        return deck
-    return shuffle_composite_function
-
-def plot_riffle_overhand(shuffles, ntrials=100, deal=deal_naive, players=4):
+def plot_riffle_overhand(shuffles, ntrials=100, deal=deal_naive_batch, players=4):
     """Plot a composite of riffle shuffles and overhand shuffles.  
 
     `shuffles` is a list of 0's and 1's.  0 means use a riffle
     shuffle, and 1 means use an overhand shuffle.  These shuffles will
     be performed in sequence, and plotted at each step.
     """
-    for name,deck in decks.items():
-        prob = []
-        for i in range(0, len(shuffles)):
-            method = compose_methods(shuffles[0:i], [methods['riffle_gsr'], methods['overhand']])
-            thisprob = []
-            for _ in range(0, ntrials):
-                thisprob.append(math.log10(1e-10+test(method(deck()), deal=deal, players=players)))
-            prob.append(sum(thisprob))
-        plt.plot(range(0, len(shuffles)), prob, label=name)
+    plot_trials(composite_trials(shuffles, ntrials=ntrials, deal=deal, players=players, handsize=HANDSIZE))
 
 
 # You can play with these if you want, but they just look like shifted
@@ -246,3 +191,30 @@ def plot_riffle_overhand(shuffles, ntrials=100, deal=deal_naive, players=4):
 # plot_riffle_overhand([0, 1, 0, 0])
 # plt.show()
 
+
+
+#   ___
+#  / __|___ _ ___ _____ _ _ __ _ ___ _ _  __ ___
+# | (__/ _ \ ' \ V / -_) '_/ _` / -_) ' \/ _/ -_)
+#  \___\___/_||_\_/\___|_| \__, \___|_||_\__\___|
+#                          |___/
+
+# Exact distance from a uniformly random deck, rather than simulated
+# hands.  Only the GSR riffle shuffle has a formula which works for a
+# full deck, so compare the rest on a small deck.
+
+from convergence import tv_gsr, tv_markov
+
+plt.figure(figsize=(6,4))
+n_shuffles = list(range(0, 16))
+plt.plot(n_shuffles, tv_gsr(52, 15), label="GSR riffle, 52 cards")
+plt.plot(n_shuffles, tv_gsr(8, 15), label="GSR riffle, 8 cards")
+plt.plot(n_shuffles, tv_markov("riffle", 8, 15, p_switch=.45), label="My riffle, 8 cards")
+plt.plot(n_shuffles, tv_markov("riffle", 8, 15, p_switch=.8), label="Expert riffle, 8 cards")
+plt.plot(n_shuffles, tv_markov("overhand", 8, 15, mean_nsplits=3), label="Overhand, 8 cards")
+plt.xlabel("Number of shuffles")
+plt.ylabel("Total variation distance")
+plt.legend()
+plt.tight_layout()
+plt.savefig("convergence.png")
+plt.show(block=False)
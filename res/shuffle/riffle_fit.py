@@ -0,0 +1,136 @@
+# Copyright 2017 Max Shinn
+# Available under the GPLv3
+# http://blog.maxshinnpotential.com/2017/11/05/how-you-should-be-shuffling-cards.html
+
+# Fitting riffle shuffle models to recorded riffles.
+#
+# A recorded riffle is a binary sequence saying which hand each card
+# fell from.  Sequences are stored in a 2-D int8 array, padded at the
+# end with -1 where sequences are shorter than the longest, and the
+# log likelihoods below are computed for every sequence at once.
+#
+# The switch model ("my riffle shuffle" in cards.py) has one Bernoulli
+# parameter, so its maximum likelihood estimate is closed form: the
+# number of switches over the number of transitions between cards.
+# `fit_bounded` is a general fallback for models without one.
+
+import numpy as np
+import scipy.special
+import scipy.optimize
+
+def pad_sequences(seqs):
+    """Convert a list of binary sequences to a 2-D int8 array, padded
+    with -1."""
+    data = np.full((len(seqs), max(len(s) for s in seqs)), -1, dtype=np.int8)
+    for i,s in enumerate(seqs):
+        data[i,0:len(s)] = s
+    return data
+
+def sequence_stats(data):
+    """For the padded array `data`, find the length of each sequence,
+    the number of cards from the left hand, and the number of
+    switches between hands."""
+    valid = data >= 0
+    lengths = np.sum(valid, axis=1)
+    n_lh = np.sum(data == 1, axis=1)
+    n_switches = np.sum((np.diff(data, axis=1) != 0) & valid[:,1:], axis=1)
+    return lengths, n_lh, n_switches
+
+def log_p_riffle_shuffle_batch(data, p_switch):
+    """Log probability of each sequence in the padded array `data`
+    under the switch model.  `p_switch` may be a single value or one
+    value per sequence."""
+    lengths, _, n_switches = sequence_stats(data)
+    return np.log(.5) + scipy.special.xlogy(n_switches, p_switch) + \
+           scipy.special.xlogy(lengths-1-n_switches, 1-p_switch)
+
+def log_p_gsr_riffle_shuffle_batch(data):
+    """Log probability of each sequence in the padded array `data`
+    under the GSR model.
+
+    The size of the left hand has probability C(L, k)/2^L, and given
+    that, each card falls with probability proportional to the size of
+    its half, so the product over cards is k!(L-k)!/L! = 1/C(L, k).
+    Thus the log probability is always -L log(2), but keep both terms
+    to mirror the model.
+    """
+    lengths, n_lh, _ = sequence_stats(data)
+    log_binom = scipy.special.gammaln(lengths+1) - scipy.special.gammaln(n_lh+1) - scipy.special.gammaln(lengths-n_lh+1)
+    log_p_handsize = log_binom - lengths*np.log(2)
+    return log_p_handsize - log_binom
+
+def information_criteria(log_likelihood, n_params, n_obs):
+    """AIC and BIC for a model with `n_params` free parameters fit to
+    `n_obs` observations."""
+    aic = 2*n_params - 2*log_likelihood
+    bic = n_params*np.log(n_obs) - 2*log_likelihood
+    return aic, bic
+
+def fit_p_switch(data, pooled=True):
+    """Maximum likelihood estimate of p_switch for the sequences in the
+    padded array `data`, with its standard error, sqrt(p(1-p)/n) for n
+    transitions.
+
+    If `pooled` is True, fit one parameter to all sequences together,
+    otherwise fit each sequence separately.  Returns arrays (or scalars
+    if pooled) of the estimates, standard errors, and maximum log
+    likelihoods.  Sequences of one card have no transitions, so they
+    get the pooled estimate, with a standard error of nan.
+    """
+    lengths, _, n_switches = sequence_stats(data)
+    transitions = lengths - 1
+    p_pooled = np.sum(n_switches)/np.sum(transitions) if np.sum(transitions) > 0 else np.nan
+    if pooled:
+        se = np.sqrt(p_pooled*(1-p_pooled)/np.sum(transitions)) if np.sum(transitions) > 0 else np.nan
+        return p_pooled, se, np.sum(log_p_riffle_shuffle_batch(data, p_pooled))
+    has_transitions = transitions > 0
+    safe = np.maximum(transitions, 1)
+    p = np.where(has_transitions, n_switches/safe, p_pooled)
+    se = np.where(has_transitions, np.sqrt(p*(1-p)/safe), np.nan)
+    return p, se, log_p_riffle_shuffle_batch(data, p)
+
+def fit_bounded(log_likelihood, bounds=(0, 1), step=1e-4):
+    """Fit a one parameter model by maximising `log_likelihood`, a
+    function of the parameter, with Brent's method within `bounds`.
+
+    The standard error comes from the curvature of the log likelihood
+    at the maximum, estimated with finite differences of size `step`,
+    and is nan if the maximum is on a bound.  Returns the estimate, its
+    standard error, and the maximum log likelihood.
+    """
+    res = scipy.optimize.minimize_scalar(lambda x : -log_likelihood(x), bounds=bounds, method="bounded")
+    x = res.x
+    if bounds[0] < x-step and x+step < bounds[1]:
+        curvature = (log_likelihood(x+step) - 2*log_likelihood(x) + log_likelihood(x-step))/step**2
+        se = 1/np.sqrt(-curvature) if curvature < 0 else np.nan
+    else:
+        se = np.nan
+    return x, se, -res.fun
+
+def fit_models(data):
+    """Fit the switch and GSR models to all sequences together, and
+    compare them.  `data` is a padded array, or an iterable of them
+    (e.g. `RiffleStore.iter_batches`) for data too big for memory.
+    Returns a dict for each model with the parameter estimate and
+    standard error (if any), log likelihood, AIC and BIC.  Raises
+    ValueError if there are no transitions between cards."""
+    batches = [data] if isinstance(data, np.ndarray) else data
+    n_obs = n_seqs = n_switches = 0
+    ll_gsr = 0
+    for batch in batches:
+        lengths, _, switches = sequence_stats(batch)
+        n_obs += np.sum(lengths)
+        n_seqs += len(lengths)
+        n_switches += np.sum(switches)
+        ll_gsr += np.sum(log_p_gsr_riffle_shuffle_batch(batch))
+    # The pooled fit only depends on the totals
+    transitions = n_obs - n_seqs
+    if transitions == 0:
+        raise ValueError("No transitions between cards to fit, all sequences have at most one card")
+    p = n_switches/transitions
+    ll = n_seqs*np.log(.5) + scipy.special.xlogy(n_switches, p) + scipy.special.xlogy(transitions-n_switches, 1-p)
+    aic, bic = information_criteria(ll, 1, n_obs)
+    riffle = {"p_switch": p, "se": np.sqrt(p*(1-p)/transitions), "log_likelihood": ll, "aic": aic, "bic": bic}
+    aic, bic = information_criteria(ll_gsr, 0, n_obs)
+    gsr = {"log_likelihood": ll_gsr, "aic": aic, "bic": bic}
+    return {"riffle": riffle, "gsr": gsr}
@@ -0,0 +1,103 @@
+# Copyright 2017 Max Shinn
+# Available under the GPLv3
+# http://blog.maxshinnpotential.com/2017/11/05/how-you-should-be-shuffling-cards.html
+
+# Compact on-disk storage of recorded riffles.
+#
+# The text format (as in riffle_data.txt) has one riffle per line, as
+# a string of 0's and 1's.  `build_store` streams it into two files:
+#
+#   - PREFIX.bits: all sequences, one after another, one bit per card
+#     (numpy.packbits, big endian bit order)
+#   - PREFIX.offsets: int64 bit offset of the start of each sequence,
+#     plus the end of the last one
+#
+# Both are memory mapped by `RiffleStore`, so only the sequences which
+# are used are read from disk, and corpora larger than memory can be
+# analysed batch by batch with `RiffleStore.iter_batches`.
+
+import os
+import numpy as np
+
+def build_store(text_file, prefix, chunk_lines=100000):
+    """Convert the riffles in `text_file` to a store at `prefix`,
+    reading `chunk_lines` lines at a time."""
+    with open(text_file, "rb") as f, open(prefix + ".bits", "wb") as fbits, open(prefix + ".offsets", "wb") as foffsets:
+        carry = np.zeros(0, dtype=np.uint8) # Bits which didn't fill a byte
+        position = 0
+        np.asarray([0], dtype=np.int64).tofile(foffsets)
+        while True:
+            lines = [l.strip() for _,l in zip(range(0, chunk_lines), f)]
+            if not lines:
+                break
+            lines = [l for l in lines if l]
+            bits = np.frombuffer(b"".join(lines), dtype=np.uint8) - ord("0")
+            if np.any(bits > 1):
+                raise ValueError("Riffles must only contain 0 and 1")
+            ends = position + np.cumsum([len(l) for l in lines], dtype=np.int64)
+            ends.tofile(foffsets)
+            position = ends[-1] if len(ends) else position
+            bits = np.concatenate([carry, bits])
+            n_whole = len(bits) - len(bits) % 8
+            np.packbits(bits[0:n_whole]).tofile(fbits)
+            carry = bits[n_whole:]
+        np.packbits(carry).tofile(fbits)
+
+class RiffleStore:
+    """Recorded riffles stored by `build_store`."""
+    def __init__(self, prefix):
+        self.offsets = np.memmap(prefix + ".offsets", dtype=np.int64, mode="r")
+        self.bits = np.memmap(prefix + ".bits", dtype=np.uint8, mode="r") if self.offsets[-1] > 0 \
+                    else np.zeros(0, dtype=np.uint8)
+    def __len__(self):
+        return len(self.offsets) - 1
+    def lengths(self):
+        """The length of each sequence."""
+        return np.diff(self.offsets)
+    def _unpack(self, start, end):
+        """Bits `start` to `end` of the concatenated sequences."""
+        raw = np.unpackbits(self.bits[start//8:(end+7)//8])
+        return raw[start%8:start%8+end-start]
+    def __getitem__(self, i):
+        """Sequence `i` as a uint8 array of 0's and 1's."""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Sequence index out of range")
+        return self._unpack(self.offsets[i], self.offsets[i+1])
+    def __iter__(self):
+        for batch_start in range(0, len(self), 10000):
+            batch_end = min(batch_start+10000, len(self))
+            offsets = np.asarray(self.offsets[batch_start:batch_end+1])
+            bits = self._unpack(offsets[0], offsets[-1])
+            for s,e in zip(offsets[:-1]-offsets[0], offsets[1:]-offsets[0]):
+                yield bits[s:e]
+    def iter_batches(self, batch_size=100000):
+        """Iterate through the sequences `batch_size` at a time, as 2-D
+        int8 arrays padded with -1 (see riffle_fit.py)."""
+        for batch_start in range(0, len(self), batch_size):
+            batch_end = min(batch_start+batch_size, len(self))
+            offsets = np.asarray(self.offsets[batch_start:batch_end+1])
+            bits = self._unpack(offsets[0], offsets[-1]).astype(np.int8)
+            starts = offsets[:-1] - offsets[0]
+            lengths = np.diff(offsets)
+            pos = starts[:,None] + np.arange(0, max(np.max(lengths), 1))
+            valid = pos < (starts + lengths)[:,None]
+            yield np.where(valid, bits[np.minimum(pos, len(bits)-1)] if len(bits) else 0, -1).astype(np.int8)
+    def padded(self):
+        """All sequences as one padded array.  Only use this when they
+        fit in memory."""
+        return next(self.iter_batches(max(len(self), 1)), np.zeros((0, 0), dtype=np.int8))
+
+def open_store(text_file, prefix=None):
+    """Open the store for `text_file`, (re)building it first if it is
+    missing or older than `text_file`.  By default, the store is kept
+    in the "cache" directory next to `text_file`."""
+    if prefix is None:
+        directory = os.path.join(os.path.dirname(text_file), "cache")
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, os.path.splitext(os.path.basename(text_file))[0])
+    if not all(os.path.exists(prefix + ext) and os.path.getmtime(prefix + ext) >= os.path.getmtime(text_file)
+               for ext in [".bits", ".offsets"]):
+        build_store(text_file, prefix)
+    return RiffleStore(prefix)
@@ -0,0 +1,36 @@
+# Copyright 2017 Max Shinn
+# Available under the GPLv3
+# http://blog.maxshinnpotential.com/2017/11/05/how-you-should-be-shuffling-cards.html
+
+# Tests for cards.py, run with pytest
+
+import itertools
+import collections
+import math
+import pytest
+import cards
+
+@pytest.mark.parametrize("hand_size", [1, 2, 3, 4])
+def test_exact_distributions(hand_size):
+    """The exact pattern distributions match a brute force count over
+    every hand.  The uncached functions are used so that nothing is
+    written to the cache."""
+    counts = collections.Counter()
+    for hand in itertools.combinations(sorted(cards.DECK), hand_size):
+        counts[(cards.get_suit_pattern(hand), cards.get_rank_pattern(hand), cards.get_cluster_pattern(hand))] += 1
+    total = math.comb(len(cards.DECK), hand_size)
+    joint = {k : v/total for k,v in counts.items()}
+    def marginal(f):
+        m = collections.Counter()
+        for k,p in joint.items():
+            m[f(k)] += p
+        return m
+    expected = {"suit_rank_cluster": joint,
+                "suit": marginal(lambda k : k[0]),
+                "rank": marginal(lambda k : k[1]),
+                "cluster": marginal(lambda k : k[2]),
+                "suit_cluster": marginal(lambda k : (k[0], k[2]))}
+    for name,dist in expected.items():
+        exact = getattr(cards, "exact_%s_distribution" % name).__wrapped__(hand_size)
+        assert exact.keys() == dist.keys(), name
+        assert all(exact[k] == pytest.approx(p) for k,p in dist.items()), name
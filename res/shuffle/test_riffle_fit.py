@@ -0,0 +1,27 @@
+# Copyright 2017 Max Shinn
+# Available under the GPLv3
+# http://blog.maxshinnpotential.com/2017/11/05/how-you-should-be-shuffling-cards.html
+
+# Tests for riffle_fit.py, run with pytest
+
+import numpy as np
+import pytest
+import riffle_fit
+
+def test_fit_bounded_matches_closed_form():
+    """Brent's method finds the closed form p_switch MLE and its
+    standard error."""
+    rng = np.random.default_rng(0)
+    seqs = [np.cumsum(rng.random(n) < .4) % 2 for n in rng.integers(20, 60, size=50)]
+    data = riffle_fit.pad_sequences(seqs)
+    p, se, ll = riffle_fit.fit_p_switch(data)
+    p_b, se_b, ll_b = riffle_fit.fit_bounded(lambda x : np.sum(riffle_fit.log_p_riffle_shuffle_batch(data, x)))
+    assert p_b == pytest.approx(p, abs=1e-4)
+    assert se_b == pytest.approx(se, rel=1e-2)
+    assert ll_b == pytest.approx(ll)
+
+def test_fit_models_needs_transitions():
+    with pytest.raises(ValueError):
+        riffle_fit.fit_models(riffle_fit.pad_sequences([[1], [0]]))
+    with pytest.raises(ValueError):
+        riffle_fit.fit_models(iter([]))
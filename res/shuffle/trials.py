@@ -0,0 +1,118 @@
+# Copyright 2017 Max Shinn
+# Available under the GPLv3
+# http://blog.maxshinnpotential.com/2017/11/05/how-you-should-be-shuffling-cards.html
+
+# Trials behind the figures in make_figures.py, kept separate from the
+# plotting so that they can be run headless and cached.
+#
+# Each function runs a whole grid of decks (from the `decks`
+# dictionary) and shuffles, shuffling `ntrials` decks at once with the
+# batched shuffles in cards.py.  When shuffles are repeated, the same
+# decks are shuffled once more for each step, rather than starting
+# again from a new deck, so n steps take O(n) shuffles instead of
+# O(n^2).  Results are a table (a numpy structured array) with one row
+# per deck and step, with columns:
+#
+#   - method: the shuffling method, as described by each function
+#   - deck: the name of the starting deck
+#   - x: the step (e.g. the number of shuffles or piles)
+#   - score: the total log10 probability (plus 1e-10) of the hands
+#     dealt from the decks, under the exact joint distribution of suit,
+#     rank, and cluster patterns.  Higher is more random.
+
+import random
+import functools
+import numpy as np
+from cards import (file_cache, decks, methods_batch, pile_methods_batch, deck_batch,
+                   deal_naive_batch, score_hands, pattern_table, exact_suit_rank_cluster_distribution)
+
+def _result_table(rows):
+    """Convert a list of (method, deck, x, score) rows to a results
+    table, with the string columns wide enough for the longest
+    value."""
+    width = lambda i : max([len(r[i]) for r in rows] + [1])
+    dtype = [("method", "U%i" % width(0)), ("deck", "U%i" % width(1)), ("x", "i4"), ("score", "f8")]
+    return np.array(rows, dtype=dtype)
+
+@functools.lru_cache()
+def _score_table(handsize):
+    return pattern_table(exact_suit_rank_cluster_distribution(handsize), handsize)
+
+def score_decks(shuffled, deal=deal_naive_batch, players=4, handsize=6):
+    """Total log10 probability of the hands dealt from the array of
+    decks `shuffled` with the batched deal function `deal`."""
+    hands = deal(shuffled, players=players, handsize=handsize)
+    return np.sum(np.log10(1e-10 + score_hands(hands, _score_table(handsize))))
+
+def _seed_decks(seed):
+    """A random.Random for the deck generators and a numpy Generator
+    for the shuffles, both seeded with `seed`, so that the global
+    random state is left alone."""
+    return random.Random(seed), np.random.default_rng(seed)
+
+@file_cache.cache
+def shuffle_trials(method_names, n_shuffles=10, ntrials=100, deal=deal_naive_batch, players=4, handsize=6, seed=0):
+    """Score each deck after 0, 1, ..., `n_shuffles`-1 repetitions of
+    each method in `method_names` (keys of `methods_batch`)."""
+    deck_rng, rng = _seed_decks(seed)
+    rows = []
+    for method in method_names:
+        for name,deck in decks.items():
+            shuffled = deck_batch(deck, ntrials, deck_rng)
+            for n in range(0, n_shuffles):
+                rows.append((method, name, n, score_decks(shuffled, deal, players, handsize)))
+                shuffled = methods_batch[method](shuffled, rng=rng)
+    return _result_table(rows)
+
+@file_cache.cache
+def pile_trials(randomizations=("none", "pickup", "distribute", "fully"), pile_ns=range(1, 15), ntrials=100,
+                deal=deal_naive_batch, players=4, handsize=6, seed=0):
+    """Score each deck after one pile shuffle with each number of piles
+    in `pile_ns`, for each of `randomizations` (keys of
+    `pile_methods_batch`)."""
+    deck_rng, rng = _seed_decks(seed)
+    rows = []
+    for randomize in randomizations:
+        if randomize not in pile_methods_batch:
+            raise ValueError("Invalid pile randomization type")
+        for name,deck in decks.items():
+            start = deck_batch(deck, ntrials, deck_rng)
+            for n in pile_ns:
+                shuffled = pile_methods_batch[randomize](start, n, rng=rng)
+                rows.append((randomize, name, n, score_decks(shuffled, deal, players, handsize)))
+    return _result_table(rows)
+
+@file_cache.cache
+def composite_trials(shuffles, shuffle_methods=("riffle_gsr", "overhand"), ntrials=100,
+                     deal=deal_naive_batch, players=4, handsize=6, seed=0):
+    """Score each deck after each step of a sequence of shuffles.
+
+    `shuffles` is a list of indices into `shuffle_methods` (keys of
+    `methods_batch`), so with the defaults, 0 is a riffle shuffle and 1
+    is an overhand shuffle.  Step i has had the first i shuffles.  The
+    method column is the sequence, e.g. "0100".
+    """
+    deck_rng, rng = _seed_decks(seed)
+    label = "".join(str(s) for s in shuffles)
+    rows = []
+    for name,deck in decks.items():
+        shuffled = deck_batch(deck, ntrials, deck_rng)
+        for i in range(0, len(shuffles)):
+            rows.append((label, name, i, score_decks(shuffled, deal, players, handsize)))
+            shuffled = methods_batch[shuffle_methods[shuffles[i]]](shuffled, rng=rng)
+    return _result_table(rows)
+
+def select(results, **columns):
+    """Rows of `results` matching each column=value in `columns`."""
+    mask = np.ones(len(results), dtype=bool)
+    for k,v in columns.items():
+        mask &= results[k] == v
+    return results[mask]
+
+if __name__ == "__main__":
+    # Run (and cache) the grids used by make_figures.py, without plotting
+    for method,n_shuffles in [("riffle_me", 10), ("riffle_gsr", 10), ("riffle_bad", 15), ("riffle_expert", 10),
+                              ("overhand", 50), ("overhand_many", 50), ("overhand_few", 50)]:
+        shuffle_trials([method], n_shuffles)
+    for randomize in ["none", "pickup", "distribute", "fully"]:
+        pile_trials([randomize])